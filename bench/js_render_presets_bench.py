@@ -0,0 +1,291 @@
+""" Render Presets Benchmark
+
+Measures the plugin's hot paths outside of LightWave, against synthetic preset
+libraries of increasing size. The plugin runs on the fake lwsdk module in this
+folder, so no LightWave installation is needed.
+
+Usage:
+    python bench/js_render_presets_bench.py [-n 10 100 1000] [-r 5]
+
+Each library size is measured in a process of its own, so the peak memory
+reported is for that size alone. For every operation the latency of the first
+run, and the median and max of all runs, is reported together with the peak
+resident memory of the process after the operation. Peak memory is read with
+the resource module, which is only available on Unix.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import collections
+import multiprocessing
+from timeit import default_timer
+
+# The fake lwsdk is found next to this script, and the plugin one folder up
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import lwsdk
+import js_render_presets
+import js_render_presets_core
+from js_render_presets_core import Presets, Definitions, Writer, Columns, \
+    PRESETS_FILE
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+# Library sizes measured by default
+SIZES = [10, 100, 1000, 10000, 100000]
+# Share of the generated presets that are derived from another preset
+DERIVED_SHARE = 0.2
+# Operations in the order they're measured
+OPERATIONS = ['load', 'save', 'save_flush', 'load_binary', 'save_binary', \
+    'query', 'open_panel', 'create_controls', 'refresh_controls', \
+    'store_preset', 'apply']
+
+
+# ------------------------------------------------------------------------------
+# Library Generation
+# ------------------------------------------------------------------------------
+def random_value(ctl, rng):
+    """ @return A random value for a control """
+    kind = ctl['type']
+    if kind == 'bool':
+        return rng.randint(0, 1)
+    if kind == 'int':
+        return rng.randint(0, 16)
+    if kind == 'float':
+        return round(rng.uniform(0, 10), 3)
+    if kind == 'percent':
+        return round(rng.uniform(0, 100), 1)
+    if kind == 'angle':
+        return round(rng.uniform(0, 90), 1)
+    if kind == 'wpopup':
+        return rng.randrange(len(ctl['items']))
+    return [rng.randint(0, 255) for i in xrange(3)]
+
+
+def generate(path, count, seed):
+    """ Write a presets file with random presets.
+
+    Most presets enable some sections and change a handful of values, and
+    the rest are derived from an earlier preset with a few overrides.
+
+    @param  string  path   Path to the presets file to write
+    @param  int     count  Number of presets
+    @param  int     seed   Seed for the random values
+    """
+    rng = random.Random(seed)
+    definitions = Presets.definitions
+    controls = definitions.controls.values()
+    presets = collections.OrderedDict()
+    names = []
+
+    for i in xrange(count):
+        body = collections.OrderedDict()
+        if names and rng.random() < DERIVED_SHARE:
+            body['parent'] = rng.choice(names)
+            edits = rng.randint(1, 3)
+        else:
+            for section_id in definitions.sections:
+                if rng.random() < 0.5:
+                    body[section_id] = 1
+            edits = rng.randint(2, 12)
+        for ctl in rng.sample(controls, edits):
+            body[ctl['command']] = random_value(ctl, rng)
+        if rng.random() < 0.1:
+            body['comment'] = 'Generated preset %d' % i
+
+        name = 'Preset %d' % (i + 1)
+        presets[name] = body
+        names.append(name)
+
+    f = open(path, 'w')
+    json.dump({'version': __version__, 'presets': presets}, f, indent=4)
+    f.close()
+
+
+# ------------------------------------------------------------------------------
+# Measuring
+# ------------------------------------------------------------------------------
+def peak_memory():
+    """ @return The peak resident memory of the process, in MiB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, and OS X bytes
+    if sys.platform == 'darwin':
+        return peak / 1048576.0
+    return peak / 1024.0
+
+
+def measure(operation, repeat, prepare=None):
+    """ Time an operation.
+
+    @param   function  operation  The operation to time
+    @param   int       repeat     Number of runs
+    @param   function  prepare    Called untimed before each run, with the
+                                  number of the run
+
+    @return  Tuple of the first, median and max latency in ms, and the peak
+             memory in MiB
+    """
+    times = []
+    for i in xrange(repeat):
+        if prepare:
+            prepare(i)
+        start = default_timer()
+        operation()
+        times.append((default_timer() - start) * 1000.0)
+
+    first = times[0]
+    times.sort()
+    return first, times[len(times) // 2], times[-1], peak_memory()
+
+
+def run_size(count, repeat, seed):
+    """ Measure all operations against a library of a given size.
+
+    @param   int  count   Number of presets in the library
+    @param   int  repeat  Number of runs per operation
+    @param   int  seed    Seed for the generated library
+
+    @return  List of (operation, first, median, max, peak memory) tuples
+    """
+    folder = tempfile.mkdtemp(prefix='js_render_presets_bench')
+    try:
+        lwsdk.SETTINGS_DIR = folder
+        Presets.definitions = Definitions.load()
+        Presets.path = os.path.join(folder, PRESETS_FILE)
+        generate(Presets.path, count, seed)
+
+        # Write the file once in the plugin's own format, with its index
+        Presets.load()
+        Presets.changed()
+        Presets.save()
+        Writer.flush()
+
+        results = []
+        results.append(('load',) + measure(Presets.load, repeat))
+
+        name = Presets.names[count // 2]
+
+        def change(i):
+            Presets.set(name, 'comment', 'Changed %d' % i)
+        results.append(('save',) + measure(Presets.save, repeat, change))
+        Writer.flush()
+
+        # Until the presets are written by the writer thread
+        def save_flush():
+            Presets.save()
+            Writer.flush()
+        results.append(('save_flush',) + measure(save_flush, repeat, change))
+
+        # The same in the binary format, and then back to json for the rest
+        js_render_presets_core.BINARY_PRESETS = True
+        Presets.changed()
+        save_flush()
+        results.append(('load_binary',) + measure(Presets.load, repeat))
+        results.append(('save_binary',) + measure(save_flush, repeat, change))
+        js_render_presets_core.BINARY_PRESETS = False
+        Presets.changed()
+        save_flush()
+        Presets.load()
+
+        # The first query reads every preset into the columns, and the rest
+        # only the preset changed before it
+        def query():
+            Columns.filter([('EnableRadiosity', '==', 1), \
+                ('RaysPerEvaluation', '>', 100)])
+        results.append(('query',) + measure(query, repeat, change))
+
+        # From creating the plugin, which loads the presets, to the panel
+        # being opened
+        def open_panel():
+            js_render_presets.RenderPresetsMaster(None).inter_ui()
+        results.append(('open_panel',) + measure(open_panel, repeat))
+
+        master = js_render_presets.RenderPresetsMaster(None)
+        master._ui = lwsdk.LWPanels()
+
+        def new_panel(i):
+            master._panel = master._ui.create('Render Presets')
+        results.append(('create_controls',) + \
+            measure(master.create_controls, repeat, new_panel))
+
+        # Select the preset in the middle of the list
+        row = count // 2
+        master._controls[0].set_int(row)
+        master._selection = row
+        results.append(('refresh_controls',) + \
+            measure(master.refresh_controls, repeat))
+
+        # Keep the coalesced saves out of the measurement, they're measured
+        # by save
+        js_render_presets_core.SAVE_INTERVAL = float('inf')
+
+        def edit_comment(i):
+            master._controls[11]['ctl'].set_str('Edited %d' % i)
+        results.append(('store_preset',) + \
+            measure(master.store_preset, repeat, edit_comment))
+
+        def new_scene(i):
+            del lwsdk.COMMANDS[:]
+        results.append(('apply',) + measure(master.apply, repeat, new_scene))
+
+        return results
+    finally:
+        shutil.rmtree(folder, True)
+
+
+# ------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark Render Presets against synthetic libraries.')
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=SIZES,
+        help='number of presets in each library (default: %s)' % \
+            ' '.join(str(n) for n in SIZES))
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+        help='number of runs per operation (default: 5)')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+        help='seed for the generated libraries (default: 0)')
+    args = parser.parse_args(argv)
+
+    print '%8s  %-18s %10s %10s %10s %10s' % \
+        ('presets', 'operation', 'first ms', 'median ms', 'max ms', 'peak MiB')
+    for count in args.sizes:
+        # A fresh process per size, so the peak memory is for that size alone
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            results = pool.apply(run_size, (count, args.repeat, args.seed))
+        finally:
+            pool.close()
+            pool.join()
+
+        for operation, first, median, slowest, peak in results:
+            print '%8d  %-18s %10.2f %10.2f %10.2f %10.1f' % \
+                (count, operation, first, median, slowest, peak)
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
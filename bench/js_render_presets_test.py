@@ -0,0 +1,181 @@
+""" Render Presets Tests
+
+Checks the plugin's behavior outside of LightWave, on the fake lwsdk module in
+this folder.
+
+Usage:
+    python bench/js_render_presets_test.py
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# The fake lwsdk is found next to this script, and the plugin one folder up
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import lwsdk
+import js_render_presets
+from js_render_presets_core import Presets, Plans, Definitions, Writer, \
+    Servers, Columns, PRESETS_FILE
+
+
+# ------------------------------------------------------------------------------
+# Tests
+# ------------------------------------------------------------------------------
+class ApplyTest(unittest.TestCase):
+    """ Applying presets to the scene. """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='js_render_presets_test')
+        lwsdk.SETTINGS_DIR = self.folder
+        Presets.definitions = Definitions.load()
+        Presets.path = os.path.join(self.folder, PRESETS_FILE)
+        Presets.load()
+        self.master = js_render_presets.RenderPresetsMaster(None)
+
+    def tearDown(self):
+        Writer.flush()
+        Presets.dirty = False
+        shutil.rmtree(self.folder, True)
+
+    def preset(self, name, gradient):
+        """ Add a preset that enables every section and changes every
+        setting from its default.
+
+        @param   string  name      Name of the preset
+        @param   int     gradient  1 for a gradient backdrop, 0 for a color
+
+        @return  The name
+        """
+        Presets.add(name)
+        for section_id in Presets.definitions.sections:
+            Presets.set(name, section_id, 1)
+        for cmd, ctl in Presets.definitions.controls.iteritems():
+            default = ctl['default']
+            if ctl['type'] == 'minirgb':
+                value = [(c + 64) % 256 for c in default]
+            elif ctl['type'] == 'wpopup':
+                value = (default + 1) % len(ctl['items'])
+            elif ctl['type'] == 'bool':
+                value = 0 if default else 1
+            else:
+                value = default + 3
+            Presets.set(name, cmd, value)
+        Presets.set(name, 'RadiosityInterpolation', 1)
+        Presets.set(name, 'GradientBackdrop', gradient)
+        return name
+
+    def test_reapply(self):
+        """ Applying a preset again only sends what can't be read back. """
+        for gradient in [0, 1]:
+            plan = Plans.plan(self.preset('Preset %d' % gradient, gradient))
+            unreadable = len([op for op in plan if op.probe is None])
+            self.assertTrue(unreadable <= 4)
+
+            self.master.run_plan(plan)
+            sent, skipped = self.master.run_plan(plan)
+            self.assertEqual(sent, unreadable)
+            self.assertEqual(skipped, len(plan) - unreadable)
+
+
+class ColumnsTest(unittest.TestCase):
+    """ Setting values in many presets. """
+
+    def setUp(self):
+        Presets.definitions = Definitions.load()
+
+    def test_check(self):
+        """ Values a setting can't hold are refused. """
+        for key, value in [('RaysPerEvaluation', 600),
+                ('RadiosityIntensity', 1.5), ('RadiosityType', 2),
+                ('EnableRadiosity', 1), ('BackdropColor', [0, 128, 255])]:
+            Columns.check(key, value)
+        for key, value in [('RaysPerEvaluation', 'abc'),
+                ('RaysPerEvaluation', 1.5), ('RadiosityType', 9),
+                ('EnableRadiosity', 2), ('BackdropColor', 5),
+                ('BackdropColor', [1, 2]), ('BackdropColor', [1, 2, 300])]:
+            self.assertRaises(ValueError, Columns.check, key, value)
+        self.assertRaises(KeyError, Columns.check, 'Radiosity', 1)
+
+
+class ServersTest(unittest.TestCase):
+    """ Finding the servers of plugin instances in the MasterHandler list. """
+
+    def setUp(self):
+        Servers.index = {}
+        Servers.instances = {}
+        Servers.free = None
+        Servers.added = None
+        self.servers = ['Other', 'js_Render_Presets', 'Other']
+        self.queries = 0
+
+    def query(self, index):
+        self.queries += 1
+        if 1 <= index <= len(self.servers):
+            return self.servers[index - 1]
+        return None
+
+    def add(self):
+        """ Add a server like the button does, and create its instance. """
+        Servers.find('js_Render_Presets_New', self.query)
+        Servers.add('js_Render_Presets', Servers.free)
+        self.servers.append('js_Render_Presets')
+        instance = object()
+        Servers.created(instance)
+        return instance
+
+    def remove(self, index):
+        del self.servers[index - 1]
+        Servers.remove('js_Render_Presets', index)
+
+    def test_own(self):
+        """ Each instance removes its own server. """
+        first = object()
+        self.assertEqual(Servers.own(first, 'js_Render_Presets', \
+            self.query), 2)
+        second = self.add()
+        self.assertEqual(Servers.instances[second], 4)
+
+        # A server before them is removed by someone else
+        del self.servers[0]
+        self.queries = 0
+        self.assertEqual(Servers.own(second, 'js_Render_Presets', \
+            self.query), 3)
+        self.assertEqual(Servers.own(first, 'js_Render_Presets', \
+            self.query), 1)
+
+        # The second instance is closed, then the first
+        index = Servers.own(second, 'js_Render_Presets', self.query)
+        self.assertEqual(index, 3)
+        self.remove(index)
+        self.queries = 0
+        self.assertEqual(Servers.own(first, 'js_Render_Presets', \
+            self.query), 1)
+        self.assertEqual(self.queries, 1)
+
+    def test_ambiguous(self):
+        """ An instance doesn't take a server it can't tell apart. """
+        self.servers.append('js_Render_Presets')
+        self.assertEqual(Servers.own(object(), 'js_Render_Presets', \
+            self.query), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
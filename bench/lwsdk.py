@@ -0,0 +1,474 @@
+""" Fake lwsdk
+
+A pure Python stand-in for the parts of LightWave's lwsdk module that Render
+Presets uses, so the plugin can be run and benchmarked outside of LightWave.
+
+Panels and controls keep their values and positions, but draw nothing.
+Commands are recorded in COMMANDS, and the render settings they set change the
+Scene, Camera and Backdrop classes that the info classes read from.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import math
+import tempfile
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+AFUNC_OK = 1
+AFUNC_BADAPP = 0
+
+PANF_BLOCKING = 1 << 0
+PANF_NOBUTT = 1 << 3
+
+LWFTYPE_SETTING = 9
+
+SRVTAG_USERNAME = 1 << 0
+SRVTAG_BUTTONNAME = 1 << 1
+SRVTAG_MENU = 1 << 2
+LANGID_USENGLISH = 0x0409
+
+LWROPT_SHADOWTRACE = 1 << 0
+LWROPT_REFLECTTRACE = 1 << 1
+LWROPT_REFRACTTRACE = 1 << 2
+LWROPT_FIELDS = 1 << 3
+LWROPT_EVENFIELDS = 1 << 4
+LWROPT_MOTIONBLUR = 1 << 5
+LWROPT_DEPTHOFFIELD = 1 << 6
+LWROPT_LIMITEDREGION = 1 << 7
+LWROPT_PARTICLEBLUR = 1 << 8
+LWROPT_ENHANCEDAA = 1 << 9
+LWROPT_SAVEANIM = 1 << 10
+LWROPT_SAVERGB = 1 << 11
+LWROPT_SAVEALPHA = 1 << 12
+LWROPT_ZBUFFERAA = 1 << 13
+LWROPT_RTTRANSPARENCIES = 1 << 14
+LWROPT_RADIOSITY = 1 << 15
+LWROPT_CAUSTICS = 1 << 16
+LWROPT_OCCLUSION = 1 << 17
+LWROPT_RENDERLINES = 1 << 18
+LWROPT_INTERPOLATED = 1 << 19
+LWROPT_BLURBACKGROUND = 1 << 20
+LWROPT_USETRANSPARENCY = 1 << 21
+LWROPT_VOLUMETRICRADIOSITY = 1 << 22
+LWROPT_USEAMBIENT = 1 << 23
+LWROPT_DIRECTIONALRAYS = 1 << 24
+LWROPT_LIMITDYNAMICRANGE = 1 << 25
+LWROPT_CACHERADIOSITY = 1 << 26
+LWROPT_USEGRADIENTS = 1 << 27
+LWROPT_USEBEHINDTEST = 1 << 28
+
+# Commands sent with command(), in order
+COMMANDS = []
+
+# Folder returned by LWDirInfoFunc(), set before the plugin is created
+SETTINGS_DIR = tempfile.gettempdir()
+
+
+# ------------------------------------------------------------------------------
+# Functions
+# ------------------------------------------------------------------------------
+def command(cmd):
+    """ Record a command, and set the render setting it changes. """
+    COMMANDS.append(cmd)
+    parts = cmd.split()
+    name, args = parts[0], parts[1:]
+    if name in TOGGLES:
+        Scene.renderOpts ^= TOGGLES[name]
+    elif name in FLAGS and args:
+        if float(args[0]):
+            Scene.renderOpts |= FLAGS[name]
+        else:
+            Scene.renderOpts &= ~FLAGS[name]
+    elif name in VALUES and args:
+        state, attr, convert = VALUES[name]
+        setattr(state, attr, convert(args[0]))
+    elif name in COLORS and len(args) == 3:
+        Backdrop.colors[COLORS[name]] = tuple(float(arg) for arg in args)
+    elif name in SQUEEZES and args:
+        Backdrop.squeezes[SQUEEZES[name]] = float(args[0])
+    return 1
+
+
+def LWDirInfoFunc(file_type):
+    """ @return The settings folder, for all file types """
+    return SETTINGS_DIR
+
+
+def MasterFactory(name, cls):
+    return (name, cls)
+
+
+def GenericFactory(name, cls):
+    return (name, cls)
+
+
+# ------------------------------------------------------------------------------
+# Plugin Classes
+# ------------------------------------------------------------------------------
+class IMaster(object):
+    def __init__(self):
+        pass
+
+
+class IGeneric(object):
+    def __init__(self):
+        pass
+
+
+# ------------------------------------------------------------------------------
+# Global Classes
+# ------------------------------------------------------------------------------
+class Scene:
+    """ The state of the scene, as read by LWSceneInfo. """
+    name = 'Untitled'
+    filename = ''
+    renderOpts = 0
+    adaptiveSampling = 0
+    adaptiveThreshold = 0.1
+    recursionDepth = 16
+    rayPrecision = 6.0
+    rayCutoff = 0.01
+    shadingSamples = 1
+    lightSamples = 1
+    minSamplesPerPixel = 1
+    maxSamplesPerPixel = 1
+    filter = 0
+    radiosityType = 0
+    radiosityIntensity = 1.0
+    radiosityIndirectBounceCount = 1
+    radiosityRaysPerEvaluation1 = 64
+    radiosityRaysPerEvaluation2 = 32
+    radiosityAngularTolerance = 0.5
+    radiosityMinPixelSpacing = 3.0
+    radiosityMaxPixelSpacing = 100.0
+    radiosityMultiplier = 1.0
+
+
+class Camera:
+    """ The state of the render camera, as read by LWCameraInfo. """
+    noiseSampler = 0
+    overSampling = 0.0
+
+
+class Backdrop:
+    """ The state of the backdrop, as read by LWBackdropInfo. """
+    type = 0
+    # Zenith, sky, ground and nadir colors, and the sky and ground squeeze
+    colors = [(0.0, 0.0, 0.0)] * 4
+    squeezes = [2.0, 2.0]
+
+
+class LWSceneInfo(object):
+    def __getattr__(self, name):
+        return getattr(Scene, name)
+
+    def renderCamera(self, time):
+        return 1
+
+
+class LWCameraInfo(object):
+    def noiseSampler(self, camera):
+        return Camera.noiseSampler
+
+    def overSampling(self, camera, time):
+        return Camera.overSampling
+
+
+class LWBackdropInfo(object):
+    def __getattr__(self, name):
+        return getattr(Backdrop, name)
+
+    def color(self, time):
+        return tuple(Backdrop.colors)
+
+    def squeeze(self, time):
+        return tuple(Backdrop.squeezes)
+
+
+class LWInterfaceInfo(object):
+    curTime = 0.0
+
+
+class LWItemInfo(object):
+    # Master plugins in the scene, by server index
+    servers = []
+
+    def server(self, item, cls, index):
+        if 1 <= index <= len(self.servers):
+            return self.servers[index - 1]
+        return None
+
+
+class LWMessageFuncs(object):
+    # Answers given to dialogs
+    name = ''
+    yes = True
+
+    def askName(self, title, label, name):
+        return LWMessageFuncs.name
+
+    def yesNo(self, title, text, text2=''):
+        return LWMessageFuncs.yes
+
+    def error(self, text, text2=''):
+        pass
+
+    def info(self, text, text2=''):
+        pass
+
+
+# ------------------------------------------------------------------------------
+# Command Effects
+# ------------------------------------------------------------------------------
+# Commands that toggle a render option flag
+TOGGLES = {
+    'RayTraceShadows': LWROPT_SHADOWTRACE,
+    'RayTraceReflection': LWROPT_REFLECTTRACE,
+    'RayTraceTransparency': LWROPT_RTTRANSPARENCIES,
+    'RayTraceRefraction': LWROPT_REFRACTTRACE,
+    'RayTraceOcclusion': LWROPT_OCCLUSION,
+    'EnableRadiosity': LWROPT_RADIOSITY,
+    'RadiosityInterpolation': LWROPT_INTERPOLATED,
+    'BlurBackgroundRadiosity': LWROPT_BLURBACKGROUND,
+    'RadiosityTransparency': LWROPT_USETRANSPARENCY,
+    'LimitDynamicRange': LWROPT_LIMITDYNAMICRANGE
+}
+
+# Commands that set a render option flag on or off
+FLAGS = {
+    'DepthBufferAA': LWROPT_ZBUFFERAA,
+    'RenderLines': LWROPT_RENDERLINES,
+    'VolumetricRadiosity': LWROPT_VOLUMETRICRADIOSITY,
+    'RadiosityUseAmbient': LWROPT_USEAMBIENT,
+    'RadiosityDirectionalRays': LWROPT_DIRECTIONALRAYS,
+    'RadiosityUseGradients': LWROPT_USEGRADIENTS,
+    'RadiosityUseBehindTest': LWROPT_USEBEHINDTEST
+}
+
+
+# Commands that set a backdrop color, and a squeeze, by index
+COLORS = {'ZenithColor': 0, 'SkyColor': 1, 'GroundColor': 2, 'NadirColor': 3}
+SQUEEZES = {'SkySqueezeColor': 0, 'GroundSqueezeColor': 1}
+
+
+def radians(arg):
+    """ @return An angle argument in degrees, in radians """
+    return math.radians(float(arg))
+
+
+# Commands that set a value, as the state class and attribute it's read from,
+# and the conversion of the argument
+VALUES = {
+    'RayRecursionLimit': (Scene, 'recursionDepth', int),
+    'RayPrecision': (Scene, 'rayPrecision', float),
+    'RayCutoff': (Scene, 'rayCutoff', float),
+    'ShadingSamples': (Scene, 'shadingSamples', int),
+    'LightSamples': (Scene, 'lightSamples', int),
+    'RadiosityType': (Scene, 'radiosityType', int),
+    'RadiosityIntensity': (Scene, 'radiosityIntensity', float),
+    'IndirectBounces': (Scene, 'radiosityIndirectBounceCount', int),
+    'RaysPerEvaluation': (Scene, 'radiosityRaysPerEvaluation1', int),
+    'RaysPerEvaluation2': (Scene, 'radiosityRaysPerEvaluation2', int),
+    'RadiosityTolerance': (Scene, 'radiosityAngularTolerance', radians),
+    'RadiosityMinPixelSpacing': (Scene, 'radiosityMinPixelSpacing', float),
+    'RadiosityMaxPixelSpacing': (Scene, 'radiosityMaxPixelSpacing', float),
+    'RadiosityMultiplier': (Scene, 'radiosityMultiplier', float),
+    'MinAntialiasing': (Scene, 'minSamplesPerPixel', int),
+    'MaxAntialiasing': (Scene, 'maxSamplesPerPixel', int),
+    'ReconstructionFilter': (Scene, 'filter', int),
+    'AdaptiveSampling': (Scene, 'adaptiveSampling', int),
+    'AdaptiveThreshold': (Scene, 'adaptiveThreshold', float),
+    'NoiseSampler': (Camera, 'noiseSampler', int),
+    'Oversampling': (Camera, 'overSampling', float),
+    'GradientBackdrop': (Backdrop, 'type', int)
+}
+
+
+# ------------------------------------------------------------------------------
+# Panels
+# ------------------------------------------------------------------------------
+class Control(object):
+    """ A control, which keeps its value and position. """
+
+    def __init__(self, label='', w=100, h=20):
+        self.label = label
+        self._value = 0
+        self._x = 0
+        self._y = 0
+        self._w = w
+        self._h = h
+        self.event = None
+
+    def set_int(self, value):
+        self._value = value
+
+    def get_int(self):
+        return self._value
+
+    def set_float(self, value):
+        self._value = value
+
+    def get_float(self):
+        return self._value
+
+    def set_ivec(self, r, g, b):
+        self._value = (r, g, b)
+
+    def get_ivec(self):
+        return self._value
+
+    def set_str(self, value):
+        self._value = value
+
+    def get_str(self):
+        return self._value
+
+    def move(self, x, y):
+        self._x = x
+        self._y = y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def w(self):
+        return self._w
+
+    def h(self):
+        return self._h
+
+    def set_w(self, w):
+        self._w = w
+
+    def set_h(self, h):
+        self._h = h
+
+    def set_event(self, fn, data=None):
+        self.event = (fn, data)
+
+    def set_select(self, fn, data=None):
+        self.event = (fn, data)
+
+    def ghost(self):
+        pass
+
+    def unghost(self):
+        pass
+
+    def erase(self):
+        pass
+
+    def render(self):
+        pass
+
+    def redraw(self):
+        pass
+
+
+class Panel(object):
+    """ A panel, which creates controls but never shows them. """
+
+    def __init__(self, title):
+        self.title = title
+        self.controls = []
+        self._w = 0
+        self._h = 0
+
+    def _add(self, label, w=100):
+        control = Control(label, w)
+        self.controls.append(control)
+        return control
+
+    def setw(self, w):
+        self._w = w
+
+    def seth(self, h):
+        self._h = h
+
+    def setmaxh(self, h):
+        pass
+
+    def set_close_callback(self, fn, data=None):
+        self.close_callback = fn
+
+    def open(self, flags):
+        return 1
+
+    def close(self):
+        pass
+
+    def align_controls_vertical(self, controls):
+        """ Stack the controls below the first one. """
+        y = None
+        for control in controls:
+            if y is None:
+                y = control.y()
+            control.move(control.x(), y)
+            y += control.h() + 4
+
+    def listbox_ctl(self, label, w, rows, name_fn, count_fn):
+        return self._add(label, w)
+
+    def tabchoice_ctl(self, label, items):
+        return self._add(label)
+
+    def wbutton_ctl(self, label, w):
+        return self._add(label, w)
+
+    def wpopup_ctl(self, label, items, w):
+        return self._add(label, w)
+
+    def area_ctl(self, label, w, h):
+        return self._add(label, w)
+
+    def border_ctl(self, label, w, h):
+        return self._add(label, w)
+
+    def text_ctl(self, label, lines):
+        return self._add(label)
+
+    def str_ctl(self, label, chars):
+        return self._add(label)
+
+    def bool_ctl(self, label):
+        return self._add(label)
+
+    def int_ctl(self, label):
+        return self._add(label)
+
+    def float_ctl(self, label):
+        return self._add(label)
+
+    def percent_ctl(self, label):
+        return self._add(label)
+
+    def angle_ctl(self, label):
+        return self._add(label)
+
+    def minirgb_ctl(self, label):
+        return self._add(label)
+
+
+class LWPanels(object):
+    def create(self, title):
+        return Panel(title)
+
+    def destroy(self, panel):
+        pass
@@ -19,18 +19,16 @@ __lwver__      = '11'
 # ------------------------------------------------------------------------------
 import os
 import sys
-import json
-import math
 import lwsdk
-import webbrowser
-import collections
 
+# The core module is kept next to this script
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from js_render_presets_core import Presets, Plans, Definitions, Stats, \
+    Writer, Servers, Library, Costs, CODECS, DEFINITIONS_FILE, PRESETS_FILE, \
+    STATS_ENABLED, SHARED_LIBRARY, SHOW_COSTS
 
-# ------------------------------------------------------------------------------
-# Constants
-# ------------------------------------------------------------------------------
-DEFINITIONS_FILE = 'js_render_presets.def'
-PRESETS_FILE = 'js_render_presets.cfg'
+# Name of the master plugin in the MasterHandler list
+SERVER_NAME = 'js_Render_Presets'
 
 
 # ------------------------------------------------------------------------------
@@ -50,7 +48,14 @@ class RenderPresetsMaster(lwsdk.IMaster):
         # (as get_int() won't return -1 for deselections, we track it ourselves)
         self._selection = -1
 
-        # Load user defined presets
+        # Keep the index of the server the button added for this instance
+        Servers.created(self)
+
+        # Load user defined presets, from LightWave's config folder. The
+        # definitions are needed to load them into records.
+        Presets.definitions = Definitions.load()
+        folder = lwsdk.LWDirInfoFunc(lwsdk.LWFTYPE_SETTING)
+        Presets.path = os.path.join(folder, PRESETS_FILE)
         Presets.load()
 
     def __del__(self):
@@ -87,6 +92,8 @@ class RenderPresetsMaster(lwsdk.IMaster):
             self._panel.set_close_callback(self.panel_close_callback)
 
             if self.create_controls():
+                # Pick up what other sessions have saved to a shared library
+                Library.refresh()
                 self._panel.open(lwsdk.PANF_NOBUTT)
 
         return lwsdk.AFUNC_OK
@@ -101,6 +108,10 @@ class RenderPresetsMaster(lwsdk.IMaster):
         """
         # We better make sure the presets are stored and saved
         self.store_preset()
+        Presets.save()
+        Writer.flush()
+        if STATS_ENABLED:
+            Stats.write_log()
 
         # Calling destroy() here, crashes LightWave (v11.0), so I have it
         # commented out, and relies on only setting the variables to None.
@@ -109,11 +120,16 @@ class RenderPresetsMaster(lwsdk.IMaster):
         self._ui = None
         self._controls = None
 
-        # Perhaps it would be better to remove the plugin completely when
-        # closing the window? I keep that line here, commented out, during dev
-        # until I've decided. If I keep it, I need to add a method to find the
-        # actual index in the Master Plugins list.
-        lwsdk.command('RemoveServer MasterHandler 1')
+        # Remove the plugin completely when closing the window, from where
+        # it's found in the Master Plugins list.
+        # Other instances of the plugin have servers with the same name, so
+        # it's the server of this instance that's removed.
+        item_info = lwsdk.LWItemInfo()
+        index = Servers.own(self, SERVER_NAME, \
+            lambda i: item_info.server(None, Servers.CLASS, i))
+        if index is not None:
+            lwsdk.command('RemoveServer MasterHandler ' + str(index))
+            Servers.remove(SERVER_NAME, index)
 
     def button_callback(self, id, user_data):
         """ Handle clicks on on main buttons in the Panel. """
@@ -128,31 +144,39 @@ class RenderPresetsMaster(lwsdk.IMaster):
         self.store_preset()
 
         # Reference part of the definitions dictionary
-        tabs = Presets.definitions['tabs']
+        tabs = Presets.definitions.tabs
         sel_tab = Presets.get_tab_name(self._controls[1].get_int())
 
-        # Loop through tabs
+        # Loop through tabs, creating the selected tab if it's shown for the
+        # first time
         for tab in tabs:
             if sel_tab == tab:
+                self.create_tab_controls(tab)
                 self.enable_controls(tabs[tab])
-            else:
+            elif tab in self._built:
                 self.erase_controls(tabs[tab])
 
         self.refresh_controls()
 
     def enable_in_preset_callback(self, id, user_data):
         """ Handle GUI updates with the section enabling buttons. """
-        tabs = Presets.definitions['tabs']
+        tabs = Presets.definitions.tabs
         sel_tab = Presets.get_tab_name(self._controls[1].get_int())
         self.enable_controls(tabs[sel_tab])
 
     def about_url_callback(self, id, user_data):
         """ Handles callbacks from the buttons in the about window. """
+        # Only imported when used, as it's slow to import
+        import webbrowser
         webbrowser.open_new_tab(self._urls[user_data])
 
     # Preset List Callbacks
     def preset_name_callback(self, control, userdata, row):
-        return Presets.names[row]
+        name = Presets.names[row]
+        # The estimated render cost follows the name
+        if SHOW_COSTS:
+            return '%s  %s' % (name, Costs.label(name))
+        return name
 
     def preset_count_callback(self, control, userdata):
         return len(Presets.names)
@@ -177,22 +201,14 @@ class RenderPresetsMaster(lwsdk.IMaster):
 
         @return  False if definitions file failed to load
         """
-        # Get the path to the definitions file. The same location as the script.
-        script_file = os.path.realpath(__file__)
-        dir_path = os.path.dirname(script_file)
-        def_file = os.path.join(dir_path, DEFINITIONS_FILE)
-
-        # Load the JSON data into an OrderedDict
-        try:
-            f = open(def_file, 'r')
-            Presets.definitions = json.load( \
-                f, object_pairs_hook=collections.OrderedDict)
-            f.close()
-        except:
+        # Load the compiled definitions
+        Presets.definitions = Definitions.load()
+        if Presets.definitions is None:
             print >>sys.stderr, 'The file %s was not found.' % DEFINITIONS_FILE
             return False
 
-        # Define Main controls
+        # Define Main controls. The first button of each column is placed
+        # below the list, and the panel stacks the rest below it.
         self._controls = {
             0: {'ctl': None, 'lbl': 'List'},
             1: {'ctl': None, 'lbl': 'Tabs'},
@@ -227,8 +243,8 @@ class RenderPresetsMaster(lwsdk.IMaster):
             val['ctl'] = self._panel.wbutton_ctl(val['lbl'], w)
             val['ctl'].set_event(self.button_callback, key)
 
-            x = 0 if val['x'] is None else val['x']
-            val['ctl'].move(x, 282)
+            if val['x'] is not None:
+                val['ctl'].move(val['x'], 282)
 
             # Make two lists with the controllers to split in two columns.
             if val['col'] == 'l':
@@ -244,7 +260,7 @@ class RenderPresetsMaster(lwsdk.IMaster):
         # Reference part of the definitions dictionary
         tabline_ctl = self._panel.area_ctl('', 310, 0)
         tabline_ctl.move(180, 20)
-        tabs = Presets.definitions['tabs']
+        tabs = Presets.definitions.tabs
         tab_names = []
         for key in tabs:
             tab_names.append(key.encode('utf-8'))
@@ -258,141 +274,137 @@ class RenderPresetsMaster(lwsdk.IMaster):
         self._controls[11]['ctl'] = self._panel.str_ctl('Comment', 50)
         self._controls[11]['ctl'].move(180, 390)
 
-        # Setup the controllers for preset definitions
+        # The controllers for the preset definitions are created per tab, the
+        # first time the tab is shown. Created tabs that are hidden are only
+        # marked as stale when the selected preset changes, and are refreshed
+        # when shown again.
+        self._built = set()
+        self._stale = set()
+        # Last value set in, or read from, each controller by setting
+        self._shown = {'comment': ''}
+        # The tab with its controls enabled to match the preset
+        self._enabled = None
+        self.create_tab_controls(Presets.get_tab_name(0))
+
+        self.refresh_main_buttons()
+        return True
+
+    def create_tab_controls(self, tab):
+        """ Creates the controls of a tab, the first time the tab is shown.
+
+        @param  string  tab  The name of the tab
+        """
+        if tab in self._built:
+            return
+        self._built.add(tab)
+
+        # Reference part of the definitions dictionary
+        tabs = Presets.definitions.tabs
+
+        # The sections are numbered across all tabs
         enable = 0
-        for tab in tabs:
-            y = 30
-            prev_col = ''
-            del left_column[:]
-            del right_column[:]
+        for name in tabs:
+            if name == tab:
+                break
+            enable += len(tabs[name])
 
-            # loop the sections
-            for k, v in tabs[tab].iteritems():
-                # Hard code the offsets for the sections. I'll probably remove
-                # sections in a future update, so I take the quick way out now
-                if tab == "Camera" and y > 30:
-                    y = 240
-                if tab == "Effects" and y > 30:
-                    y = 260
-
-                v['ctl'] = self._panel.bool_ctl('Enable in Preset')
-                v['ctl'].set_w(150)
-                v['ctl'].move(180, y)
-                v['ctl'].set_event(self.enable_in_preset_callback, enable)
-                y += 30
-
-                if tab == 'Render':
-                    v['ctl'].ghost()
-                else:
-                    v['ctl'].erase()
+        y = 30
+        prev_col = ''
+        left_column = []
+        right_column = []
 
-                # Loop controls in the sections
-                for ctl in v['controls']:
+        # loop the sections
+        for k, v in tabs[tab].iteritems():
+            # Hard code the offsets for the sections. I'll probably remove
+            # sections in a future update, so I take the quick way out now
+            if tab == "Camera" and y > 30:
+                y = 240
+            if tab == "Effects" and y > 30:
+                y = 260
+
+            v['ctl'] = self._panel.bool_ctl('Enable in Preset')
+            self._shown[k] = 0
+            v['ctl'].set_w(150)
+            v['ctl'].move(180, y)
+            v['ctl'].set_event(self.enable_in_preset_callback, enable)
+            y += 30
+
+            # Ghosted until the tab is enabled
+            v['ctl'].ghost()
 
-                    ctl['enable'] = enable
+            # Loop controls in the sections
+            for ctl in v['controls']:
 
-                    ctl2 = getattr(self._panel, ctl['type'] + '_ctl')
-                    if ctl['type'] in ['bool', 'int', 'float', 'angle', 'percent']:
-                        ctl['ctl'] = ctl2(ctl['label'])
-                        try:
-                            width = ctl['width']
-                        except:
-                            width = 150
-                        ctl['ctl'].set_w(width)
+                ctl['enable'] = enable
 
-                    if ctl['type'] in ['wpopup']:
-                        # Get rid of Unicode character (u')
-                        items = [s.encode('utf-8') for s in ctl['items']]
-                        ctl['ctl'] = ctl2(ctl['label'], items, 150)
+                # Create the controller and set its default value
+                ctl['ctl'] = ctl['codec'].create(self._panel, ctl)
+                ctl['codec'].set(ctl['ctl'], ctl['default'])
+                self._shown[ctl['command']] = ctl['default']
 
-                    if ctl['type'] in ['minirgb']:
-                        ctl['ctl'] = ctl2(ctl['label'])
-                        ctl['ctl'].set_ivec(200, 200, 200)
+                if ctl['column'] == 'right':
+                    right_column.append(ctl['ctl'])
+                    ctl['ctl'].move(360, y)
+                    if ctl['type'] == 'minirgb':
+                        ctl['ctl'].move(260, y)
+                else:
+                    ctl['ctl'].move(180, y)
+                    left_column.append(ctl['ctl'])
 
-                    # Consolidate this with the one in refresh_controls into a function
-                    if ctl['type'] in ['bool', 'int', 'wpopup']:
-                        ctl['ctl'].set_int(ctl['default'])
+                if ctl['column'] == prev_col:
+                    y += 10
 
-                    if ctl['type'] in ['float', 'percent']:
-                        ctl['ctl'].set_float(ctl['default'])
+                if ctl['column'] == 'right':
+                    prev_col = 'right'
+                else:
+                    prev_col = 'left'
+
+                ctl['ctl'].ghost()
+
+            enable += 1
+        # Align the controllers in columns
+        if tab in ['Render', 'Global Illum']:
+            self._panel.align_controls_vertical(left_column)
+        self._panel.align_controls_vertical(right_column)
 
+        # Move the controls back in X for a tighter layout
+        if tab == 'Render':
+            offset = 24
+        elif tab == 'Global Illum':
+            offset = 54
+        elif tab == 'Camera':
+            offset = 114
+        elif tab == 'Effects':
+            for k, v in tabs[tab].iteritems():
+                for ctl in v['controls']:
                     if ctl['type'] in ['minirgb']:
-                        rgb = ctl['default']
-                        ctl['ctl'].set_ivec(rgb[0], rgb[1], rgb[2])
-
-                    if ctl['type'] in ['angle']:
-                        rad = math.radians(ctl['default'])
-                        ctl['ctl'].set_float(rad)
-
-                    if ctl['column'] == 'right':
-                        right_column.append(ctl['ctl'])
-                        ctl['ctl'].move(360, y)
-                        if ctl['type'] == 'minirgb':
-                            ctl['ctl'].move(260, y)
-                    else:
-                        ctl['ctl'].move(180, y)
-                        left_column.append(ctl['ctl'])
-
-                    if ctl['column'] == prev_col:
-                        y += 10
-
-                    if ctl['column'] == 'right':
-                        prev_col = 'right'
-                    else:
-                        prev_col = 'left'
-
-                    if tab == 'Render':
-                        ctl['ctl'].ghost()
-                    else:
-                        ctl['ctl'].erase()
-
-                enable += 1
-            # Align the controllers in columns
-            if tab in ['Render', 'Global Illum']:
-                self._panel.align_controls_vertical(left_column)
-            self._panel.align_controls_vertical(right_column)
-
-            # Move the controls back in X for a tighter layout
-            if tab == 'Render':
-                offset = 24
-            elif tab == 'Global Illum':
-                offset = 54
-            elif tab == 'Camera':
-                offset = 114
-            elif tab == 'Effects':
-                for k, v in tabs[tab].iteritems():
-                    for ctl in v['controls']:
-                        if ctl['type'] in ['minirgb']:
-                            y = ctl['ctl'].y()
-                            x = ctl['ctl'].x()
-                            ctl['ctl'].move(x - 80, y)
-                offset = 1
-
-            # Tighten up the Y distances
-            if tab in ['Render', 'Global Illum']:
-                offset_y = 0
-                for ctl in left_column:
-                    y = ctl.y()
-                    x = ctl.x()
-                    ctl.move(x, y - offset_y)
-                    offset_y += 5
+                        y = ctl['ctl'].y()
+                        x = ctl['ctl'].x()
+                        ctl['ctl'].move(x - 80, y)
+            offset = 1
+
+        # Tighten up the Y distances
+        if tab in ['Render', 'Global Illum']:
             offset_y = 0
-            for ctl in right_column:
+            for ctl in left_column:
                 y = ctl.y()
                 x = ctl.x()
-                ctl.move(x - offset, y - offset_y)
+                ctl.move(x, y - offset_y)
                 offset_y += 5
-                # Hard code the offsets for the sections. I'll probably remove
-                # sections in a future update, so I take the quick way out now
-                if tab == 'Render' and offset_y == 15:
-                    offset_y -= 25
-                if tab == 'Camera' and offset_y == 35:
-                    offset_y -= 50
-                if tab == 'Effects' and offset_y == 40:
-                    offset_y -= 50
-
-        self.refresh_main_buttons()
-        return True
+        offset_y = 0
+        for ctl in right_column:
+            y = ctl.y()
+            x = ctl.x()
+            ctl.move(x - offset, y - offset_y)
+            offset_y += 5
+            # Hard code the offsets for the sections. I'll probably remove
+            # sections in a future update, so I take the quick way out now
+            if tab == 'Render' and offset_y == 15:
+                offset_y -= 25
+            if tab == 'Camera' and offset_y == 35:
+                offset_y -= 50
+            if tab == 'Effects' and offset_y == 40:
+                offset_y -= 50
 
     def enable_controls(self, tab):
         """ Enable controls in tab.
@@ -401,22 +413,33 @@ class RenderPresetsMaster(lwsdk.IMaster):
         """
         # Loop sections
         for k, v in tab.iteritems():
-            v['ctl'].render()
-            v['ctl'].unghost()
-            enable = v['ctl'].get_int()
-            # Loop controls in section
-            for ctl in v['controls']:
-                ctl['ctl'].render()
-                if enable:
-                    ctl['ctl'].unghost()
-                else:
-                    ctl['ctl'].ghost()
+            self.enable_section(v)
+        self._enabled = tab
+
+    def enable_section(self, section):
+        """ Enable the controls of a section if it's enabled in the preset,
+        and ghost them if not.
+
+        @param  ref  section  Pointer to the section in the dict
+        """
+        section['ctl'].render()
+        section['ctl'].unghost()
+        enable = section['ctl'].get_int()
+        # Loop controls in section
+        for ctl in section['controls']:
+            ctl['ctl'].render()
+            if enable:
+                ctl['ctl'].unghost()
+            else:
+                ctl['ctl'].ghost()
 
     def erase_controls(self, tab):
         """ Erase controls in tab.
 
         @param  ref  tab  Pointer to the tab in the dict to erase controls in
         """
+        if self._enabled is tab:
+            self._enabled = None
         # Loop sections
         for k, v in tab.iteritems():
             v['ctl'].erase()
@@ -429,6 +452,8 @@ class RenderPresetsMaster(lwsdk.IMaster):
 
         @param  ref  tab  Pointer to the tab in the dict to ghost controls in
         """
+        if self._enabled is tab:
+            self._enabled = None
         # Loop sections
         for k, v in tab.iteritems():
             v['ctl'].ghost()
@@ -444,7 +469,7 @@ class RenderPresetsMaster(lwsdk.IMaster):
         sel_tab = Presets.get_tab_name(self._controls[1].get_int())
 
         # Reference part of the definitions dictionary
-        tabs = Presets.definitions['tabs']
+        tabs = Presets.definitions.tabs
 
         # If nothing is selected, ghost all controls in tab
         if name == False:
@@ -453,39 +478,50 @@ class RenderPresetsMaster(lwsdk.IMaster):
             return
 
         # Get the selected presets dict to read settings from
-        settings = Presets.user['presets'][name]
+        settings = Presets.user['presets'][name].resolve()
 
-        # Loop tabs
-        for tab in tabs:
-            # Loop sections in tab
-            for k, v in tabs[tab].iteritems():
-                # Store setting if the section is enabled
-                v['ctl'].set_int(settings[k])
-
-                # Loop controls in section
-                for ctl in v['controls']:
-                    cmd = ctl['command']
+        # Only the selected tab is refreshed, the other created tabs are
+        # refreshed when they're shown
+        self._stale.update(self._built)
+        self._stale.discard(sel_tab)
 
-                    # Consolidate this with the one in create_controls into a function
+        # Loop sections in the selected tab. If the tab is already enabled,
+        # only sections that are switched on or off needs to be enabled again.
+        enabled = self._enabled is tabs[sel_tab]
+        for k, v in tabs[sel_tab].iteritems():
+            # Store setting if the section is enabled
+            switched = self.show(k, v['ctl'], CODECS['bool'], settings[k])
 
-                    # Set settings depending on controller type
-                    if ctl['type'] in ['bool', 'int', 'wpopup']:
-                        ctl['ctl'].set_int(settings[cmd])
-                    if ctl['type'] in ['float', 'percent']:
-                        ctl['ctl'].set_float(settings[cmd])
-                    if ctl['type'] in ['minirgb']:
-                        rgb = settings[cmd]
-                        ctl['ctl'].set_ivec(rgb[0], rgb[1], rgb[2])
-                    if ctl['type'] in ['angle']:
-                        rad = math.radians(settings[cmd])
-                        ctl['ctl'].set_float(rad)
+            # Loop controls in section
+            for ctl in v['controls']:
+                cmd = ctl['command']
+                self.show(cmd, ctl['ctl'], ctl['codec'], settings[cmd])
 
-                if tab == sel_tab:
-                    self.enable_controls(tabs[tab])
+            if switched or not enabled:
+                self.enable_section(v)
+        self._enabled = tabs[sel_tab]
 
-        self._controls[11]['ctl'].set_str(settings['comment'])
+        if self._shown['comment'] != settings['comment']:
+            self._controls[11]['ctl'].set_str(settings['comment'])
+            self._shown['comment'] = settings['comment']
         self.refresh_main_buttons()
 
+    def show(self, key, controller, codec, value):
+        """ Set a value in a controller, unless it's already shown.
+
+        @param  string  key         The command or section id of the setting
+        @param  object  controller  The controller
+        @param  Codec   codec       The codec of the controller
+        @param  mixed   value       The value to show
+
+        @return True if the controller was set
+        """
+        if Presets.same(self._shown[key], value):
+            return False
+        codec.set(controller, value)
+        self._shown[key] = value
+        return True
+
     def refresh_main_buttons(self):
         """ Handle ghost and unghost of main buttons depending on selection. """
         for k, v in self._controls.iteritems():
@@ -524,33 +560,40 @@ class RenderPresetsMaster(lwsdk.IMaster):
             return
 
         # Reference part of the definitions dictionary
-        tabs = Presets.definitions['tabs']
+        tabs = Presets.definitions.tabs
 
-        # Loop tabs
+        # Loop tabs that shows the preset, the others keep their stored values
         for tab in tabs:
+            if tab not in self._built or tab in self._stale:
+                continue
             # Loop sections in tab
             for k, v in tabs[tab].iteritems():
                 # Store setting if the section is enabled
                 cmd = v['id']
-                Presets.user['presets'][name][cmd] = v['ctl'].get_int()
+                self._shown[cmd] = v['ctl'].get_int()
+                Presets.set(name, cmd, self._shown[cmd])
 
                 # Loop controls in section
                 for ctl in v['controls']:
                     cmd = ctl['command']
+                    self._shown[cmd] = ctl['codec'].get(ctl['ctl'])
+                    Presets.set(name, cmd, self._shown[cmd])
 
-                    # Store setting depending on controller type
-                    if ctl['type'] in ['bool', 'int', 'wpopup']:
-                        Presets.user['presets'][name][cmd] = ctl['ctl'].get_int()
-                    if ctl['type'] in ['float', 'percent']:
-                        Presets.user['presets'][name][cmd] = ctl['ctl'].get_float()
-                    if ctl['type'] in ['minirgb']:
-                        Presets.user['presets'][name][cmd] = ctl['ctl'].get_ivec()
-                    if ctl['type'] in ['angle']:
-                        deg = math.degrees(ctl['ctl'].get_float())
-                        Presets.user['presets'][name][cmd] = deg
+        self._shown['comment'] = self._controls[11]['ctl'].get_str()
+        Presets.set(name, 'comment', self._shown['comment'])
 
-        Presets.user['presets'][name]['comment'] = self._controls[11]['ctl'].get_str()
-        Presets.save()
+        # Only writes to disk if something changed, and coalesces bursts of
+        # changes into one write.
+        Presets.request_save()
+
+        # Saving to a shared library merges the presets of other sessions,
+        # which can move the selected preset in the list
+        if SHARED_LIBRARY and Presets.get_name(row) != name:
+            self._selection = -1
+            if name in Presets.names:
+                self._selection = Presets.names.index(name)
+            self._controls[0].redraw()
+            self._controls[0].set_int(self._selection)
 
     # --------------------------------------------------------------------------
     # Button Methods
@@ -558,11 +601,7 @@ class RenderPresetsMaster(lwsdk.IMaster):
     def new(self):
         """ Add new preset. """
         # Create a unique new name
-        ctr = 1
-        name = 'Preset %s' % ctr
-        while name in Presets.names:
-            ctr += 1
-            name = 'Preset %s' % ctr
+        name = Presets.names.unique('Preset %s', 1)
 
         # Add preset and select it
         if Presets.add(name) != False:
@@ -570,9 +609,10 @@ class RenderPresetsMaster(lwsdk.IMaster):
             self.refresh_list(idx)
 
     def save(self):
-        """ Force a presets save. """
+        """ Force a presets save of any pending changes. """
         self.store_preset()
         Presets.save()
+        Writer.flush()
 
     def rename(self):
         """ Create a rename dialog. """
@@ -583,6 +623,12 @@ class RenderPresetsMaster(lwsdk.IMaster):
 
         new_name = lwsdk.LWMessageFuncs().askName('Rename Preset', 'Name', name)
 
+        # Check so we got a unique name, else return with an error message.
+        if new_name != name and new_name in Presets.names:
+            lwsdk.LWMessageFuncs().error('Name "%s" already exists.' % new_name, \
+                'rename error')
+            return
+
         Presets.rename(row, new_name)
         self.refresh_list(row)
 
@@ -617,8 +663,7 @@ class RenderPresetsMaster(lwsdk.IMaster):
 
         # move it up
         new_row = row - 1
-        # delete old, and insert it on the new index
-        Presets.names.insert(new_row, Presets.names.pop(row))
+        Presets.move(row, new_row)
 
         # Refresh GUI and selection
         self.refresh_list(new_row)
@@ -634,8 +679,7 @@ class RenderPresetsMaster(lwsdk.IMaster):
 
         # move it down
         new_row = row + 1
-        # delete old, and insert it on the new row
-        Presets.names.insert(new_row, Presets.names.pop(row))
+        Presets.move(row, new_row)
 
         # Refresh GUI and selection
         self.refresh_list(new_row)
@@ -660,6 +704,12 @@ class RenderPresetsMaster(lwsdk.IMaster):
         panel.setw(200)
         panel.seth(180)
 
+        # Show the totals of the timed functions below the buttons
+        stats = Stats.report() if STATS_ENABLED else []
+        if stats:
+            panel.setw(420)
+            panel.seth(200 + 15 * len(stats))
+
         # Create the controls
         auth_ctl = panel.text_ctl('Author:', [__author__])
         vers_ctl = panel.text_ctl('Version:', [__version__])
@@ -676,6 +726,10 @@ class RenderPresetsMaster(lwsdk.IMaster):
         supp_ctl.move(108, 80)
         cont_ctl.move(18, 110)
 
+        if stats:
+            stats_ctl = panel.text_ctl('', stats)
+            stats_ctl.move(10, 150)
+
         # Set URLs in a global list
         self._urls = [
         'http://www.artstorm.net/plugins/render-presets/',
@@ -698,339 +752,147 @@ class RenderPresetsMaster(lwsdk.IMaster):
         """ Apply selected preset. """
         row = self._controls[0].get_int()
         name = Presets.get_name(row)
+        if name == False:
+            return
 
-        # Reference part of the definitions dictionary
-        tabs = Presets.definitions['tabs']
-        # Get the selected presets dict to read settings from
-        settings = Presets.user['presets'][name]
-
-        # Loop tabs
-        for tab in tabs:
-            # Loop sections in tab
-            for k, v in tabs[tab].iteritems():
-                # If section is enabled, apply the commands in the section
-                if settings[k] == True:
-
-                    # Loop commands in section
-                    for ctl in v['controls']:
-                        # Create and set command line
-                        val = settings[ctl['command']]
-
-                        if self.gi_tab_logic(settings, ctl['command']) == False:
-                            continue
-
-                        if self.fx_tab_logic(settings, ctl['command'], val) == False:
-                            continue
-
-                        if self.cam_tab_logic(settings, ctl['command']) == False:
-                            continue
-
-                        try:
-                            mode = ctl['mode']
-                        except:
-                            mode = False
-
-                        if ctl['type'] == 'percent':
-                            val = val / 100
-
-                        if ctl['type'] == 'minirgb':
-                            val = '%(r)s %(g)s %(b)s' % \
-                            {'r': val[0] / 255.0, \
-                             'g': val[1] / 255.0, \
-                             'b': val[2] / 255.0}
-
-                        if ctl['command'] == 'ResolutionMultiplier':
-                            # Resolution Converter
-                            res = [0.25, 0.5, 1, 2, 4]
-                            val = res[val]
-
-                        # Handle buttons that just toggles their state which can
-                        # not by command be set to a specific state.
-                        if mode == 'toggle':
-                            scene = lwsdk.LWSceneInfo()
-                            render_flag = getattr(lwsdk, ctl['flag'])
-                            if render_flag & scene.renderOpts > 0:
-                                button_state = True
-                            else:
-                                button_state = False
-
-                            if val != button_state:
-                                lwsdk.command(ctl['command'])
-                        else:
-                            lwsdk.command(ctl['command'] + ' ' + str(val))
-
-                        if ctl['command'] == 'EnableRadiosity' and val == False:
-                            break
+        return self.run_plan(Plans.plan(name))
 
     # --------------------------------------------------------------------------
     # Apply Helpers
     # --------------------------------------------------------------------------
-    def gi_tab_logic(self, settings, cmd):
-        """ The controller logic for the Global Illum tab. """
-
-        # If radiosity is not interpolated, don't apply these
-        if settings['RadiosityInterpolation'] == False and cmd in \
-        ['RadiosityUseGradients', 'RadiosityUseBehindTest']:
-            return False
-
-        # Don't apply these on Backdrop Only
-        if settings['RadiosityType'] == 0 and cmd in \
-        ['IndirectBounces', 'RaysPerEvaluation2']:
-            return False
-
-        # Don't apply these on Backdrop Only/Monte Carlo, no interpolation
-        if settings['RadiosityInterpolation'] == False and \
-        settings['RadiosityType'] in [0, 1] and cmd in \
-        ['RaysPerEvaluation2', 'RadiosityTolerance', 'RadiosityMinPixelSpacing', 'RadiosityMaxPixelSpacing', 'RadiosityMultiplier']:
-            return False
-
-        return True
-
-    def fx_tab_logic(self, settings, cmd, val):
-        """ The controller logic for the Effects tab. """
-        bd_info = lwsdk.LWBackdropInfo()
-
-        # The Gradient Backdrop Button
-        if cmd == 'GradientBackdrop':
-            if bd_info.type == val:
-                return False
-        # Single color
-        if settings['GradientBackdrop'] == 1 and cmd == 'BackdropColor':
-            return False
-
-        # Gradient color
-        if settings['GradientBackdrop'] == 0 and cmd in \
-        ['ZenithColor', 'SkyColor', 'GroundColor', 'NadirColor', 'SkySqueezeColor', 'GroundSqueezeColor']:
-            return False
+    def run_plan(self, plan):
+        """ Perform the operations of an apply plan on the scene.
 
-        return True
+        Operations for settings that can be read from the scene are only sent
+        if they differ from it, and the rest are always sent, so the scene
+        ends up with the settings of the preset. LightWave runs one command
+        per call, so each operation sent is a call of its own.
 
-    def cam_tab_logic(self, settings, cmd):
-        """ The controller logic for the Camera tab. """
+        @param   tuple  plan  Operations, as returned by Plans.plan()
 
-        # Adaptive Sampling
-        scene = lwsdk.LWSceneInfo()
-        if cmd == 'AdaptiveSampling':
-            if scene.adaptiveSampling == settings[cmd]:
-                return False
+        @return  Tuple of the number of commands sent, and skipped
+        """
+        state = SceneState()
+        sent = 0
+        skipped = 0
+        for op in plan:
+            if not state.differs(op):
+                skipped += 1
+                continue
 
-        # Threshold
-        if settings['AdaptiveSampling'] == False and cmd in \
-        ['MaxAntialiasing', 'AdaptiveThreshold']:
-            return False
+            if op.arg is None:
+                lwsdk.command(op.command)
+            else:
+                lwsdk.command(op.command + ' ' + op.arg)
+            sent += 1
 
-        return True
+        return sent, skipped
 
 
 # ------------------------------------------------------------------------------
-# Presets Class
+# Scene State Class
 # ------------------------------------------------------------------------------
-class Presets:
-    """ Handles storage, loading and saving of user defined presets. """
-    # --------------------------------------------------------------------------
-    # Static variables
-    # --------------------------------------------------------------------------
-    # Predefined definitions, and control references
-    definitions = None
-    # User defined Presets
-    user = None
-    # User defined Preset Names
-    names = None
-
-    # --------------------------------------------------------------------------
-    # Methods
-    # --------------------------------------------------------------------------
-    @staticmethod
-    def load():
-        """ Loads the user presets into the class static variable """
-        # Load the JSON data into an OrderedDict
-        try:
-            # f = open(Presets.file_path()+'ad', 'r')
-            f = open(Presets.file_path(), 'r')
-            Presets.user = json.load( \
-                f, object_pairs_hook=collections.OrderedDict)
-            f.close()
-        except:
-            Presets.user = {
-            'version': __version__,
-            'presets': {}
-            }
-            Presets.names = []
-
-        Presets.names = []
-
-        for s, v in Presets.user['presets'].iteritems():
-            Presets.names.append(s.encode('utf-8'))
-
-    @staticmethod
-    def save():
-        """ Saves the user presets to a json formatted file """
-        # Recreate the presets dictionary, in the current order found in the
-        # names list, to save user sorting.
-        presets = {
-            'version': __version__,
-            'presets': collections.OrderedDict({})
-        }
-        for name in Presets.names:
-            presets['presets'][name] = Presets.user['presets'][name]
-
-        # Save the dict as json
-        f = open(Presets.file_path(), 'w')
-        json.dump(presets, f, indent=4)
-        f.close()
-
-    @staticmethod
-    def file_path():
-        """ @return Absolute path to the presets file """
-        # Get path to LightWave's config folder, and join with the filename
-        folder = lwsdk.LWDirInfoFunc(lwsdk.LWFTYPE_SETTING)
-        file_path = os.path.join(folder, PRESETS_FILE)
-        return file_path
-
-    @staticmethod
-    def add(name):
-        """ Adds a new preset.
-
-        @param   string  name  The name of the preset to add.
-        @return  False if failed to add
-        """
-        # Check so we got a unique name
-        if name in Presets.names:
-            return False
-
-        # Add the new preset to list of names and to definitions
-        Presets.names.append(name)
-        Presets.user['presets'][name] = {}
-
-        # reference part of the definitions dictionary
-        defaults = Presets.definitions['tabs']
-
-        # Set the default values for the new preset
-        for tab in defaults:
-            for section in defaults[tab]:
-                # Set default value for section bool ctl to false
-                section_id = defaults[tab][section]['id']
-                Presets.user['presets'][name][section_id] = 0
-
-                for control in defaults[tab][section]['controls']:
-                    # Set the default values from definitions for the controls.
-                    # We treat the command as an ID for the controls.
-                    cmd = control['command']
-                    Presets.user['presets'][name][cmd] = control['default']
-
-        Presets.user['presets'][name]['comment'] = ''
-        Presets.save()
-
-    @staticmethod
-    def delete(row):
-        """ Delete a preset.
-
-        @param   int    row       The row in the list to rename
-
-        @return  False if failed to delete
-        """
-        # Get name of preset to delete
-        name = Presets.get_name(row)
-
-        if name == False:
-            return False
-
-        # Remove from ordereddict and list of names
-        del Presets.user['presets'][name]
-        Presets.names.remove(name)
-
-    @staticmethod
-    def rename(row, new_name):
-        """ Rename a preset.
+class SceneState:
+    """ A snapshot of the scene state that apply plans are compared with.
 
-        @param   int    row       The row in the list to rename
-        @param   string new_name  The new name of the preset
+    The info objects are only created once per snapshot. Settings that can't
+    be read back from the scene are always considered to differ, as they
+    might have been changed in LightWave since they were last applied.
+    """
+    # Difference below which two numbers read from the scene are the same, as
+    # commands are sent with the values as text
+    TOLERANCE = 1e-6
 
-        @return  False if failed to rename
-        """
-        # Get the old name
-        old_name = Presets.get_name(row)
+    def __init__(self):
+        self.infos = {}
+        self.values = {}
 
-        # If the new name is the same as the old, silently return
-        if old_name == new_name:
-            return False
+    def info(self, name):
+        """ @return The info object of an info class, created once """
+        if name not in self.infos:
+            self.infos[name] = getattr(lwsdk, name)()
+        return self.infos[name]
 
-        # Check so we got a unique name, else return with an error message.
-        if new_name in Presets.names:
-            lwsdk.LWMessageFuncs().error('Name "%s" already exists.' % new_name, \
-                'rename error')
-            return False
+    def scene_value(self, name):
+        """ Get a scene value that probes are called with.
 
-        # Make a copy with the new name, and then delete the old name
-        Presets.user['presets'][new_name] = Presets.user['presets'][old_name]
-        del Presets.user['presets'][old_name]
+        @param   string  name  'camera' for the render camera, or 'time'
 
-        # Also update the list of names
-        Presets.names.insert(row, new_name)
-        Presets.names.remove(old_name)
-
-    @staticmethod
-    def duplicate(row):
-        """ Duplicate a preset.
-
-        @param   int    row       The row in the list to rename
-
-        @return  False if failed to duplicate
+        @return  The value
         """
-        if row < 0 or row >= len(Presets.names):
-            return False
-
-        # Get the old name
-        src_name = Presets.get_name(row)
-
-        # Generate the destination name
-        dest_name = src_name + ' - Copy'
-        ctr = 1
-        while dest_name in Presets.names:
-            ctr += 1
-            dest_name = src_name + ' - Copy %s' % ctr
+        if name not in self.values:
+            if name == 'time':
+                value = self.info('LWInterfaceInfo').curTime
+            elif name == 'camera':
+                value = self.info('LWSceneInfo').renderCamera( \
+                    self.scene_value('time'))
+            else:
+                raise ValueError('Unknown probe argument: %s' % name)
+            self.values[name] = value
+        return self.values[name]
 
-        # Copy the preset, and add the new name to the list of names
-        Presets.user['presets'][dest_name] = Presets.user['presets'][src_name].copy()
-        Presets.names.append(dest_name)
+    def read(self, probe):
+        """ Read a value from the scene.
 
-    # --------------------------------------------------------------------------
-    # Helpers
-    # --------------------------------------------------------------------------
-    @staticmethod
-    def get_name(row):
-        """ Return the name, or False if the row doesn't exist.
+        @param   Probe  probe  The value to read
 
-        @param   int  row  The row in the list to retrieve
-
-        @return  False if no name was found.
+        @return  The value, or None if it can't be read
         """
-        if row < 0 or row >= len(Presets.names):
-            return False
-
-        return Presets.names[row]
+        if probe not in self.values:
+            try:
+                value = getattr(self.info(probe.info), probe.attr, None)
+                if value is not None and probe.args is not None:
+                    value = value(*[self.scene_value(arg) \
+                        for arg in probe.args])
+                if value is not None and probe.index is not None:
+                    value = value[probe.index]
+                if value is not None and probe.flag:
+                    value = getattr(lwsdk, probe.flag) & value > 0
+            except (AttributeError, TypeError, IndexError):
+                # Not available in this version of LightWave
+                value = None
+            self.values[probe] = value
+        return self.values[probe]
 
     @staticmethod
-    def get_tab_name(index):
-        """ Return the tab name, or False if the tab doesn't exist.
-
-        @param   int  index  The index of the tab to retrieve
-
-        @return  False if no name was found, else the name as string.
-        """
-        # Reference part of the definitions dictionary
-        tabs = Presets.definitions['tabs']
-
-        # Make a list of tab names
-        names = []
-        for tab in tabs:
-            names.append(tab.encode('utf-8'))
+    def same(current, state):
+        """ @return True if a value read from the scene equals a state """
+        if isinstance(state, (tuple, list)):
+            try:
+                return len(current) == len(state) and \
+                    all(SceneState.same(a, b) for a, b in zip(current, state))
+            except TypeError:
+                return False
+        if isinstance(state, float) or isinstance(current, float):
+            try:
+                return abs(current - state) <= \
+                    SceneState.TOLERANCE * max(1.0, abs(state))
+            except TypeError:
+                return False
+        return current == state
+
+    def differs(self, op):
+        """ @return True if the operation would change the scene """
+        if op.probe:
+            current = self.read(op.probe)
+            if current is not None:
+                return not SceneState.same(current, op.state)
+        return True
 
-        # Return False if index out of list scope
-        if index < 0 or index >= len(names):
-            return False
 
-        return names[index]
+# ------------------------------------------------------------------------------
+# Stats
+# ------------------------------------------------------------------------------
+# Time the hot paths. lwsdk.command is timed in the module, so commands sent by
+# any plugin in the same Python session are included.
+if STATS_ENABLED:
+    Stats.instrument(Presets, 'load', 'Presets.load')
+    Stats.instrument(Presets, 'save', 'Presets.save')
+    Stats.instrument(Writer, 'write', 'Writer.write')
+    for attr in ['create_controls', 'refresh_controls', 'store_preset', \
+    'apply']:
+        Stats.instrument(RenderPresetsMaster, attr)
+    Stats.instrument(lwsdk, 'command', 'lwsdk.command')
 
 
 # ------------------------------------------------------------------------------
@@ -1041,5 +903,5 @@ ServerTagInfo = [
 ]
 
 ServerRecord = {
-    lwsdk.MasterFactory('js_Render_Presets', RenderPresetsMaster): ServerTagInfo
+    lwsdk.MasterFactory(SERVER_NAME, RenderPresetsMaster): ServerTagInfo
 }
@@ -0,0 +1,152 @@
+""" Render Presets Batch
+
+Applies a render preset to LightWave scene files from the command line, without
+running LightWave. Only the render, radiosity, camera and backdrop lines of the
+sections enabled in the preset are rewritten, following the same rules as when
+the preset is applied in LightWave.
+
+Usage:
+    python js_render_presets_batch.py -c js_render_presets.cfg PRESET PATH...
+
+Directories are searched recursively for scene files. Scenes are rewritten in
+place, unless an output directory is given.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+from js_render_presets_core import Presets, Plans, Definitions, Scenes
+
+
+# ------------------------------------------------------------------------------
+# Worker Process
+# ------------------------------------------------------------------------------
+# The scene edits, set in each worker process when the pool starts
+_edits = None
+
+
+def init_worker(edits):
+    """ Initialize a worker process with the edits to apply. """
+    global _edits
+    _edits = edits
+
+
+def rewrite_scene(job):
+    """ Rewrite one scene in a worker process.
+
+    @param   tuple  job  The source and destination path
+
+    @return  Tuple of the source path, the result from Scenes.rewrite() and an
+             error message or None.
+    """
+    src, dest = job
+    try:
+        folder = os.path.dirname(dest)
+        if folder and not os.path.isdir(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                # Created by another worker in the meantime
+                pass
+        return src, Scenes.rewrite(src, dest, _edits), None
+    except (IOError, OSError), e:
+        return src, None, str(e)
+
+
+# ------------------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------------------
+def find_scenes(paths, output=None):
+    """ Find the scene files to rewrite.
+
+    @param   list    paths   Scene files and directories to search
+    @param   string  output  Directory to write to, None to rewrite in place
+
+    @return  Generator of (source, destination) path tuples
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            dest = path
+            if output:
+                dest = os.path.join(output, os.path.basename(path))
+            yield path, dest
+            continue
+
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                if not name.lower().endswith(Scenes.EXTENSION):
+                    continue
+                src = os.path.join(root, name)
+                dest = src
+                if output:
+                    dest = os.path.join(output, os.path.relpath(src, path))
+                yield src, dest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Apply a render preset to LightWave scene files.')
+    parser.add_argument('preset', help='name of the preset to apply')
+    parser.add_argument('paths', nargs='+', metavar='path',
+        help='scene file or directory of scene files')
+    parser.add_argument('-c', '--presets', required=True,
+        help='path to js_render_presets.cfg')
+    parser.add_argument('-d', '--definitions',
+        help='path to js_render_presets.def (default: next to this script)')
+    parser.add_argument('-o', '--output',
+        help='directory to write the scenes to (default: in place)')
+    parser.add_argument('-j', '--jobs', type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    Presets.definitions = Definitions.load(args.definitions)
+    if Presets.definitions is None:
+        parser.error('could not load the definitions file')
+
+    Presets.path = os.path.abspath(args.presets)
+    Presets.load()
+    if args.preset not in Presets.names:
+        parser.error('no preset named "%s"' % args.preset)
+
+    edits = Scenes.edits(Plans.plan(args.preset))
+    jobs = find_scenes(args.paths, args.output)
+
+    scenes = changed = failed = 0
+    start = time.time()
+    pool = multiprocessing.Pool(args.jobs, init_worker, (edits,))
+    for src, result, error in pool.imap_unordered(rewrite_scene, jobs, 16):
+        if error:
+            print >>sys.stderr, '%s: %s' % (src, error)
+            failed += 1
+        elif result is not None:
+            scenes += 1
+            if result:
+                changed += 1
+    pool.close()
+    pool.join()
+    elapsed = time.time() - start
+
+    print '%d scenes, %d changed, %d failed in %.2f s (%.1f scenes/s)' % \
+        (scenes, changed, failed, elapsed, scenes / max(elapsed, 1e-6))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,8 +19,14 @@ __lwver__       = '11'
 # ------------------------------------------------------------------------------
 # Import Modules
 # ------------------------------------------------------------------------------
+import os
+import sys
 import lwsdk
 
+# The core module is kept next to this script
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from js_render_presets_core import Servers
+
 
 # ------------------------------------------------------------------------------
 # Generic Plugin Class
@@ -36,32 +42,23 @@ class RenderPresetsButton(lwsdk.IGeneric):
         item_info = lwsdk.LWItemInfo()
 
         # Check if Render Presets Master is already added
-        index = 1
-        server_added = False
-        while True:
-            server_name = item_info.server(None, 'MasterHandler', index)
-
-            # Reached end of list, break loop
-            if server_name == None:
-                break
-
-            # Render Presets Master added, break loop
-            if server_name == self.SSERVER:
-                server_added = True
-                break
-
-            index += 1
+        index = Servers.find(self.SSERVER, \
+            lambda i: item_info.server(None, Servers.CLASS, i))
 
         # Do the appropriate action on the MasterHandler Render Presets Server
-        if server_added:
+        if index is not None:
             # In production Render Presets is always started from the button
             # In development I prefer to toggle it with a remove, for testing
             if __status__ == 'Production':
                 lwsdk.command('EditServer MasterHandler ' + str(index))
             else:
                 lwsdk.command('RemoveServer MasterHandler ' + str(index))
+                Servers.remove(self.SSERVER, index)
         else:
-            # Not added, so let's add it.
+            # Not added, so let's add it. It's added at the end of the list,
+            # and the index is kept first, for the instance it creates.
+            index = Servers.free
+            Servers.add(self.SSERVER, index)
             lwsdk.command('ApplyServer MasterHandler ' + self.SSERVER)
             lwsdk.command('EditServer MasterHandler ' + str(index))
 
@@ -0,0 +1,81 @@
+""" Render Presets Convert
+
+Converts the presets between the json presets file and the binary presets file
+from the command line. The presets are loaded from whichever of the two files
+was written last, together with the journal, and written in full in the format
+asked for. Nothing is lost in either direction, so the presets can be converted
+back and forth, and a file converted back is the same as the one it was
+converted from.
+
+Usage:
+    python js_render_presets_convert.py -c js_render_presets.cfg FORMAT
+
+The binary presets file is written next to the json presets file.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import time
+import argparse
+
+from js_render_presets_core import Presets, Definitions, BinaryPresets
+
+
+# ------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert the presets between json and the binary format.')
+    parser.add_argument('format', choices=['json', 'binary'],
+        help='format to write the presets in')
+    parser.add_argument('-c', '--presets', required=True,
+        help='path to js_render_presets.cfg')
+    parser.add_argument('-d', '--definitions',
+        help='path to js_render_presets.def (default: next to this script)')
+    args = parser.parse_args(argv)
+
+    Presets.definitions = Definitions.load(args.definitions)
+    if Presets.definitions is None:
+        parser.error('could not load the definitions file')
+
+    Presets.path = os.path.abspath(args.presets)
+    start = time.time()
+    Presets.load()
+
+    # Unless the journal had changes, the presets are the same as when the
+    # file was written, and the converted file gets the same revision
+    revision = None
+    if not Presets.touched and not Presets.removed:
+        revision = Presets.library
+    try:
+        if args.format == 'binary':
+            path = Presets.binary_path()
+            BinaryPresets.write(Presets.snapshot(path, revision))
+        else:
+            path = Presets.file_path()
+            Presets.write_presets(Presets.snapshot(None, revision))
+    except (IOError, OSError), e:
+        print >>sys.stderr, 'Failed to write the presets: %s' % e
+        return 1
+
+    print '%d presets written to %s in %.2f s' % \
+        (len(Presets.names), path, time.time() - start)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,3453 @@
+""" Render Presets Core
+
+The parts of Render Presets that doesn't depend on LightWave. Handles the
+definitions, the preset library and the compiling of apply plans, so they also
+can be used by the command line tools outside of LightWave.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import time
+import array
+import struct
+import atexit
+import cPickle
+import operator
+import itertools
+import threading
+import contextlib
+import collections
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+DEFINITIONS_FILE = 'js_render_presets.def'
+# Compiled definitions, cached next to the definitions file
+DEFINITIONS_CACHE = 'js_render_presets.defc'
+PRESETS_FILE = 'js_render_presets.cfg'
+# Minimum number of seconds between two automatic saves. Edits made within
+# this interval are coalesced and written by the next save request after it.
+SAVE_INTERVAL = 2.0
+# Store changes to the presets as records appended to a journal, instead of
+# rewriting the whole presets file on every save.
+JOURNAL_ENABLED = False
+JOURNAL_FILE = 'js_render_presets.jnl'
+# Journal size in bytes, where it's folded back into the presets file.
+JOURNAL_COMPACT_SIZE = 256 * 1024
+# Index of where each preset is found in the presets file. When it's up to date
+# with the presets file, only the names are loaded, and each preset is parsed
+# when it's first used.
+PRESETS_INDEX = 'js_render_presets.cfi'
+LAZY_LOAD = True
+# Write the presets on a background thread, so saving never waits for the disk.
+ASYNC_SAVE = True
+# Save the presets in the binary format instead of as json. The presets are
+# loaded from whichever of the two files was written last.
+BINARY_PRESETS = False
+PRESETS_BINARY = 'js_render_presets.cfb'
+# Share the presets file with other sessions, like when the settings folder is
+# on a network drive. Saves are made while holding a lock on a file next to the
+# presets file, and the presets other sessions have saved are merged before each
+# save and when the panel opens. The presets are then kept as json, without the
+# journal, and loaded in full so nothing is read from a replaced file.
+SHARED_LIBRARY = False
+PRESETS_LOCK = 'js_render_presets.lck'
+# Show the estimated render cost of each preset next to its name. The weights
+# of the cost model are read from a file next to the presets file, written when
+# the model is calibrated against measured render times. Off by default, as the
+# estimate reads the settings of each listed preset and its parents, which
+# loads presets that would otherwise stay unparsed until used.
+SHOW_COSTS = False
+COST_MODEL = 'js_render_presets.cost'
+# Time the hot paths, and keep totals that are shown in the about window and
+# written to a log next to the presets file. When disabled nothing is wrapped,
+# so it costs nothing.
+STATS_ENABLED = False
+STATS_LOG = 'js_render_presets.log'
+# Log size in bytes, where it's rolled over to a backup and started over.
+STATS_LOG_SIZE = 64 * 1024
+
+
+# ------------------------------------------------------------------------------
+# Record Class
+# ------------------------------------------------------------------------------
+class Record(object):
+    """ The settings of a preset.
+
+    Values are stored in typed arrays, in the slots the definitions assign to
+    each setting. Flags (bools, popups and the section switches) are stored
+    as bytes, colors are packed into ints, and settings unknown to the
+    definitions are kept as they are. Records are saved as the values that
+    differ from the defaults.
+    """
+    __slots__ = ('definitions', 'flags', 'ints', 'floats', 'comment', 'extra')
+
+    # Kinds of slots
+    FLAG, INT, FLOAT, RGB, COMMENT = range(5)
+    # Kind of slot by control type
+    KINDS = {
+        'bool': FLAG,
+        'wpopup': FLAG,
+        'int': INT,
+        'float': FLOAT,
+        'percent': FLOAT,
+        'angle': FLOAT,
+        'minirgb': RGB
+    }
+
+    def __init__(self, definitions, values=None):
+        """ Create a record with the default values.
+
+        @param  Definitions  definitions  The definitions with the slots
+        @param  dict         values       Values to set
+        """
+        self.definitions = definitions
+        defaults = definitions.slot_defaults
+        self.flags = array.array('B', defaults[Record.FLAG])
+        self.ints = array.array('i', defaults[Record.INT])
+        self.floats = array.array('d', defaults[Record.FLOAT])
+        self.comment = ''
+        self.extra = None
+
+        if values:
+            for key, value in values.iteritems():
+                self[key] = value
+
+    def __getitem__(self, key):
+        try:
+            kind, i = self.definitions.slots[key]
+        except KeyError:
+            if self.extra is None:
+                raise
+            return self.extra[key]
+
+        if kind == Record.FLAG:
+            return self.flags[i]
+        if kind == Record.INT:
+            return self.ints[i]
+        if kind == Record.FLOAT:
+            return self.floats[i]
+        if kind == Record.RGB:
+            return Record.unpack(self.ints[i])
+        return self.comment
+
+    def __setitem__(self, key, value):
+        try:
+            kind, i = self.definitions.slots[key]
+        except KeyError:
+            if self.extra is None:
+                self.extra = collections.OrderedDict()
+            self.extra[key] = value
+            return
+
+        if kind == Record.FLAG:
+            self.flags[i] = int(value)
+        elif kind == Record.INT:
+            self.ints[i] = int(value)
+        elif kind == Record.FLOAT:
+            self.floats[i] = float(value)
+        elif kind == Record.RGB:
+            self.ints[i] = Record.pack(value)
+        else:
+            self.comment = value
+
+    def __contains__(self, key):
+        return key in self.definitions.slots or \
+            (self.extra is not None and key in self.extra)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        keys = self.definitions.slots.keys()
+        if self.extra:
+            keys.extend(self.extra.keys())
+        return keys
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def copy(self):
+        """ @return A copy of the record """
+        record = Record(self.definitions)
+        record.flags = array.array('B', self.flags)
+        record.ints = array.array('i', self.ints)
+        record.floats = array.array('d', self.floats)
+        record.comment = self.comment
+        if self.extra is not None:
+            record.extra = collections.OrderedDict(self.extra)
+        return record
+
+    def resolve(self):
+        """ @return The record itself, as it holds all its values """
+        return self
+
+    def sparse(self):
+        """ @return OrderedDict of the values that differ from the defaults """
+        values = collections.OrderedDict()
+        defaults = self.definitions.slot_defaults
+        arrays = {
+            Record.FLAG: self.flags,
+            Record.INT: self.ints,
+            Record.RGB: self.ints,
+            Record.FLOAT: self.floats
+        }
+        for key, (kind, i) in self.definitions.slots.iteritems():
+            if kind == Record.COMMENT:
+                if self.comment:
+                    values[key] = self.comment
+                continue
+            default_kind = Record.INT if kind == Record.RGB else kind
+            if arrays[kind][i] != defaults[default_kind][i]:
+                values[key] = self[key]
+        if self.extra:
+            values.update(self.extra)
+        return values
+
+    @staticmethod
+    def pack(rgb):
+        """ @return An RGB list packed into an int """
+        return (int(rgb[0]) << 16) | (int(rgb[1]) << 8) | int(rgb[2])
+
+    @staticmethod
+    def unpack(value):
+        """ @return An int unpacked into an RGB list """
+        return [(value >> 16) & 255, (value >> 8) & 255, value & 255]
+
+
+# ------------------------------------------------------------------------------
+# Derived Record Class
+# ------------------------------------------------------------------------------
+class Derived(object):
+    """ The settings of a preset derived from another preset.
+
+    Only the values that override the parent are stored. The rest are
+    resolved from the parent when first read, and kept until the parent, or
+    any preset it derives from, changes. Saved as the name of the parent
+    followed by the overrides.
+    """
+    __slots__ = ('parent', 'overrides', '_resolved', '_lineage')
+
+    def __init__(self, parent, overrides=None):
+        """ Create a record derived from a preset.
+
+        @param  string  parent     The name of the parent preset
+        @param  dict    overrides  Values that overrides the parent
+        """
+        self.parent = parent
+        self.overrides = collections.OrderedDict(overrides or ())
+        self._resolved = None
+        self._lineage = None
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __setitem__(self, key, value):
+        self.overrides[key] = value
+        if self._resolved is not None:
+            self._resolved[key] = value
+
+    def __contains__(self, key):
+        return key in self.resolve()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.resolve().keys()
+
+    def get(self, key, default=None):
+        return self.resolve().get(key, default)
+
+    def copy(self):
+        """ @return A copy of the record, derived from the same parent """
+        return Derived(self.parent, self.overrides)
+
+    def flatten(self):
+        """ @return A Record with all the values of this record """
+        return self.resolve().copy()
+
+    def resolve(self):
+        """ @return A Record with the values resolved from the parent """
+        lineage = Presets.lineage(self.parent)
+        if self._resolved is None or lineage != self._lineage:
+            # A missing parent, or a parent that in turn derives from this
+            # record, leaves the defaults to derive from
+            if lineage:
+                record = Presets.user['presets'][self.parent].resolve().copy()
+            else:
+                record = Record(Presets.definitions)
+            for key, value in self.overrides.iteritems():
+                record[key] = value
+            self._resolved = record
+            self._lineage = lineage
+        return self._resolved
+
+    def sparse(self):
+        """ @return OrderedDict of the parent and the overrides """
+        values = collections.OrderedDict([('parent', self.parent)])
+        values.update(self.overrides)
+        return values
+
+
+# ------------------------------------------------------------------------------
+# Name Index Class
+# ------------------------------------------------------------------------------
+class NameIndex:
+    """ The ordered list of preset names, indexed by name.
+
+    Looking up a name or its row, renaming and moving a name one step up or
+    down are constant time. Inserting and removing names renumbers the rows
+    after it. Unique names are generated from a counter per name pattern.
+    """
+
+    def __init__(self, names=()):
+        self._names = []
+        self._rows = {}
+        # Next number to try, by name pattern
+        self._counters = {}
+        for name in names:
+            self.append(name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __getitem__(self, row):
+        return self._names[row]
+
+    def __setitem__(self, row, name):
+        """ Replace the name on a row, for renames. """
+        del self._rows[self._names[row]]
+        self._names[row] = name
+        self._rows[name] = row
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def index(self, name):
+        """ @return The row of the name """
+        try:
+            return self._rows[name]
+        except KeyError:
+            raise ValueError('%r is not in list' % name)
+
+    def append(self, name):
+        self._rows[name] = len(self._names)
+        self._names.append(name)
+
+    def insert(self, row, name):
+        self._names.insert(row, name)
+        self._renumber(row)
+
+    def pop(self, row):
+        name = self._names.pop(row)
+        del self._rows[name]
+        self._renumber(row)
+        return name
+
+    def remove(self, name):
+        self.pop(self.index(name))
+
+    def move(self, row, new_row):
+        """ Move the name on a row to a new row. """
+        if abs(new_row - row) == 1:
+            names = self._names
+            names[row], names[new_row] = names[new_row], names[row]
+            self._rows[names[row]] = row
+            self._rows[names[new_row]] = new_row
+        else:
+            self.insert(new_row, self.pop(row))
+
+    def unique(self, pattern, start, first=None):
+        """ Generate a name that isn't in the list.
+
+        Numbers are tried from where the last name from the same pattern was
+        found, so a series of new names doesn't probe the numbers before it.
+
+        @param   string  pattern  Name pattern, with %s for the number
+        @param   int     start    The first number to try
+        @param   string  first    Name to use if free, before any numbered
+
+        @return  The name
+        """
+        if first is not None and first not in self._rows:
+            return first
+
+        ctr = self._counters.get(pattern, start)
+        name = pattern % ctr
+        while name in self._rows:
+            ctr += 1
+            name = pattern % ctr
+        self._counters[pattern] = ctr + 1
+        return name
+
+    def _renumber(self, row):
+        """ Update the rows of the names from row and onwards. """
+        names = self._names
+        for i in xrange(row, len(names)):
+            self._rows[names[i]] = i
+
+
+# ------------------------------------------------------------------------------
+# Preset Bodies Class
+# ------------------------------------------------------------------------------
+class PresetBodies:
+    """ The settings of the presets by name, parsed when first used.
+
+    Presets that haven't been used yet are kept as their location in the
+    presets file, so they can also be saved again without being parsed.
+
+    The locations are moved when the presets file is written, which can be
+    done by the writer thread, so they're only used while holding the lock.
+    """
+
+    def __init__(self, path):
+        """ @param  string  path  Path to the presets file """
+        self.path = path
+        # Parsed settings by name
+        self._bodies = {}
+        # (offset, length) in the presets file by name, for unparsed presets
+        self._locations = {}
+        # Parent by name of the unparsed presets found in the index, None for
+        # those that aren't derived
+        self._parents = {}
+        # Held while the presets file is read or replaced
+        self.lock = threading.RLock()
+        # Number of times the presets file has been written, and the new
+        # offsets by old offset from the last time
+        self.generation = 0
+        self.moved = {}
+
+    def __contains__(self, name):
+        return name in self._bodies or name in self._locations
+
+    def __getitem__(self, name):
+        try:
+            return self._bodies[name]
+        except KeyError:
+            pass
+
+        with self.lock:
+            f = self.open()
+            if f is None:
+                raise KeyError(name)
+            try:
+                body = self.decode(self._locations[name], f)
+            finally:
+                f.close()
+
+        self[name] = body
+        return self._bodies[name]
+
+    def __setitem__(self, name, body):
+        body = PresetBodies.convert(body)
+        with self.lock:
+            self._bodies[name] = body
+            self._locations.pop(name, None)
+            self._parents.pop(name, None)
+
+    def __delitem__(self, name):
+        with self.lock:
+            if name in self._locations:
+                del self._locations[name]
+                self._parents.pop(name, None)
+            else:
+                del self._bodies[name]
+
+    def locate(self, locations, parents=None):
+        """ Set where unparsed presets are found in the presets file.
+
+        @param  list  locations  (name, offset, length) of the presets
+        @param  dict  parents    Parent by name, None if not derived, of the
+                                 presets where it's known
+        """
+        with self.lock:
+            for name, offset, length in locations:
+                self._locations[name] = (offset, length)
+            if parents:
+                self._parents.update(parents)
+
+    def relocate(self, moved):
+        """ Move the unparsed presets to where they've been written.
+
+        Has to be called while holding the lock, together with replacing the
+        presets file.
+
+        @param  dict  moved  The new offsets by old offset
+        """
+        self._locations = dict((name, (moved.get(offset, offset), length)) \
+            for name, (offset, length) in self._locations.iteritems())
+        self.generation += 1
+        self.moved = moved
+
+    def snapshot(self, name):
+        """ Get a preset as it is now, for the writer thread.
+
+        Has to be called while holding the lock.
+
+        @return  A copy of the settings, or the (offset, length) of an
+                 unparsed preset
+        """
+        if name in self._bodies:
+            return self._bodies[name].copy()
+        return self._locations[name]
+
+    def parents(self):
+        """ Get the known parents of the unparsed presets, for the writer
+        thread.
+
+        Has to be called while holding the lock.
+
+        @return  Dict of parent by name, None if not derived
+        """
+        return dict(self._parents)
+
+    def parsed(self, name):
+        """ @return True if the preset has been parsed """
+        return name in self._bodies
+
+    def rename(self, old_name, new_name):
+        """ Move a preset to a new name, without parsing it. """
+        with self.lock:
+            if old_name in self._locations:
+                self._locations[new_name] = self._locations.pop(old_name)
+                if old_name in self._parents:
+                    self._parents[new_name] = self._parents.pop(old_name)
+            else:
+                self._bodies[new_name] = self._bodies.pop(old_name)
+
+    def children(self, parent):
+        """ @return Names of the presets derived from a preset """
+        names = [name for name, body in self._bodies.iteritems() \
+            if getattr(body, 'parent', None) == parent]
+
+        with self.lock:
+            unknown = []
+            for name in self._locations:
+                if name not in self._parents:
+                    unknown.append(name)
+                elif self._parents[name] == parent:
+                    names.append(name)
+
+            # Presets with no parent in the index are looked up in the file,
+            # where only those that mention a parent needs to be parsed
+            f = self.open() if unknown else None
+            if f is not None:
+                try:
+                    for name in unknown:
+                        if self.derived(name, f) and \
+                        getattr(self[name], 'parent', None) == parent:
+                            names.append(name)
+                finally:
+                    f.close()
+        return names
+
+    def open(self):
+        """ @return The presets file opened for reading, or None """
+        if not self._locations:
+            return None
+        try:
+            return open(self.path, 'rb')
+        except IOError:
+            return None
+
+    def raw(self, name, f):
+        """ Get a preset as json.
+
+        @param   string  name  The name of the preset
+        @param   file    f     The presets file, as returned by open()
+
+        @return  The settings as a json formatted string
+        """
+        if name in self._bodies:
+            return json.dumps(self._bodies[name].sparse(), \
+                separators=(', ', ': '))
+
+        offset, length = self._locations[name]
+        f.seek(offset)
+        return f.read(length)
+
+    def decode(self, location, f):
+        """ Read an unparsed preset.
+
+        @param   tuple  location  The (offset, length) of the preset
+        @param   file   f         The presets file, as returned by open()
+
+        @return  The settings, as they're stored in the file
+        """
+        offset, length = location
+        f.seek(offset)
+        return json.loads(f.read(length), \
+            object_pairs_hook=collections.OrderedDict)
+
+    def derived(self, name, f):
+        """ @return True if an unparsed preset might be derived from another """
+        return '"parent"' in self.raw(name, f)
+
+    @staticmethod
+    def convert(body):
+        """ @return The settings as a Record, or a Derived if it has a parent """
+        if isinstance(body, (Record, Derived)):
+            return body
+        if 'parent' in body:
+            overrides = collections.OrderedDict(body)
+            parent = overrides.pop('parent').encode('utf-8')
+            return Derived(parent, overrides)
+        return Record(Presets.definitions, body)
+
+
+# ------------------------------------------------------------------------------
+# Binary Preset Bodies Class
+# ------------------------------------------------------------------------------
+class BinaryBodies(PresetBodies):
+    """ The settings of the presets by name, decoded from the binary presets
+    file when first used.
+
+    Unparsed presets are kept as the location of their record. Records
+    written with the same definitions as the current are decoded straight
+    into the arrays of a Record, and others by the keys in their schema.
+    """
+
+    def __init__(self, path, schema):
+        """
+        @param  string  path    Path to the binary presets file
+        @param  dict    schema  The schema from the header of the file
+        """
+        PresetBodies.__init__(self, path)
+        self.schema = schema
+        # True if the records have the layout of the current definitions
+        self.native = BinaryPresets.native(schema)
+        # End of the flags, ints and floats in a record
+        flags, ints, floats = [len(values) for values in schema['defaults']]
+        flags_end = BinaryPresets.RECORD.size + flags
+        ints_end = flags_end + ints * BinaryPresets.INT_SIZE
+        self.ends = (flags_end, ints_end, \
+            ints_end + floats * BinaryPresets.FLOAT_SIZE)
+
+    def open(self):
+        """ @return The binary presets file mapped for reading, or None """
+        f = PresetBodies.open(self)
+        if f is None:
+            return None
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+    def decode(self, location, f):
+        """ Read an unparsed preset.
+
+        @param   tuple  location  The (offset, length) of the record
+        @param   file   f         The binary presets file
+
+        @return  The settings, as a Record if the record is native, else as
+                 a dict of the values that differs from the defaults
+        """
+        offset, length = location
+        f.seek(offset)
+        data = f.read(length)
+        kind, blob_offset, blob_length = \
+            BinaryPresets.RECORD.unpack_from(data)
+
+        values = collections.OrderedDict()
+        if blob_length:
+            f.seek(blob_offset)
+            values = json.loads(f.read(blob_length), \
+                object_pairs_hook=collections.OrderedDict)
+        if kind == BinaryPresets.DERIVED:
+            return values
+
+        start = BinaryPresets.RECORD.size
+        flags_end, ints_end, floats_end = self.ends
+        flags = array.array('B', data[start:flags_end])
+        ints = array.array('i', data[flags_end:ints_end])
+        floats = array.array('d', data[ints_end:floats_end])
+
+        if self.native:
+            record = Record.__new__(Record)
+            record.definitions = Presets.definitions
+            record.flags = flags
+            record.ints = ints
+            record.floats = floats
+            record.comment = ''
+            record.extra = None
+            for key, value in values.iteritems():
+                record[key] = value
+            return record
+
+        if self.schema['byteorder'] != sys.byteorder:
+            ints.byteswap()
+            floats.byteswap()
+        arrays = {
+            Record.FLAG: flags,
+            Record.INT: ints,
+            Record.RGB: ints,
+            Record.FLOAT: floats
+        }
+        defaults = self.schema['defaults']
+        body = collections.OrderedDict()
+        for key, kind, i in self.schema['slots']:
+            value = arrays[kind][i]
+            if value != defaults[Record.INT if kind == Record.RGB else kind][i]:
+                body[key] = Record.unpack(value) if kind == Record.RGB \
+                    else value
+        body.update(values)
+        return body
+
+    def derived(self, name, f):
+        """ @return True if an unparsed preset is derived from another """
+        offset, length = self._locations[name]
+        f.seek(offset)
+        return ord(f.read(1)) == BinaryPresets.DERIVED
+
+
+# ------------------------------------------------------------------------------
+# Presets Class
+# ------------------------------------------------------------------------------
+class Presets:
+    """ Handles storage, loading and saving of user defined presets. """
+    # --------------------------------------------------------------------------
+    # Static variables
+    # --------------------------------------------------------------------------
+    # Predefined definitions, and control references
+    definitions = None
+    # User defined Presets
+    user = None
+    # User defined Preset Names
+    names = None
+    # Path to the presets file
+    path = None
+    # Revision per preset name, set from the counter each time it changes
+    revisions = {}
+    revision = 0
+    # True when there are changes that hasn't been written to disk yet
+    dirty = False
+    # Time of the last save
+    saved_at = 0
+    # Change records not yet appended to the journal
+    pending = []
+    # Bytes in the journal, including records not yet written
+    journaled = 0
+    # Bytes written to the presets file and the journal this session
+    written = 0
+    # Revision of the presets file when it was loaded or last written, and
+    # the revision each preset was last written with
+    library = 0
+    stamps = {}
+    # Presets changed and removed since the presets file was last written
+    touched = set()
+    removed = set()
+    # (mtime, size, inode) of the presets file when last merged, shared mode
+    synced = None
+
+    # --------------------------------------------------------------------------
+    # Methods
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def load():
+        """ Loads the user presets into the class static variable """
+        # Writes still pending are part of what's loaded
+        Writer.flush()
+
+        Presets.user = {
+            'version': __version__,
+            'presets': PresetBodies(Presets.file_path())
+        }
+        Presets.names = NameIndex()
+        Presets.revisions = {}
+        Presets.dirty = False
+        Presets.pending = []
+        Presets.journaled = 0
+        Presets.library = 0
+        Presets.stamps = {}
+        Presets.touched = set()
+        Presets.removed = set()
+        Presets.synced = None
+
+        # Other sessions can't replace the file while it's read
+        with Library.locked():
+            if SHARED_LIBRARY:
+                Library.load()
+            elif BinaryPresets.load():
+                pass
+            elif not LAZY_LOAD or not Presets.load_index():
+                Presets.load_json()
+
+            Presets.replay_journal()
+        Presets.stamp()
+
+    @staticmethod
+    def load_json():
+        """ Loads all presets from the presets file. """
+        # Load the JSON data into an OrderedDict
+        try:
+            f = open(Presets.file_path(), 'r')
+            data = json.load(f, object_pairs_hook=collections.OrderedDict)
+            f.close()
+        except:
+            data = {'presets': {}}
+
+        Presets.library = data.get('revision', 0)
+        for s, v in data['presets'].iteritems():
+            name = s.encode('utf-8')
+            Presets.names.append(name)
+            Presets.user['presets'][name] = v
+
+    @staticmethod
+    def load_index():
+        """ Loads the preset names and their location in the presets file
+        from the index, if it's up to date with the presets file.
+
+        @return  False if the index couldn't be used
+        """
+        index = Presets.read_index()
+        if index is None:
+            return False
+
+        Presets.library = index['revision']
+        locations = []
+        parents = {}
+        for s, offset, length, stamp, parent in index['presets']:
+            name = s.encode('utf-8')
+            Presets.names.append(name)
+            Presets.stamps[name] = stamp
+            locations.append((name, offset, length))
+            if parent is not None:
+                parent = parent.encode('utf-8')
+            parents[name] = parent
+        Presets.user['presets'].locate(locations, parents)
+        return True
+
+    @staticmethod
+    def read_index():
+        """ @return The index, or None if it's not up to date with the
+                    presets file """
+        try:
+            st = os.stat(Presets.file_path())
+            f = open(Presets.index_path(), 'r')
+            index = json.load(f)
+            f.close()
+        except (OSError, IOError, ValueError):
+            return None
+
+        # Indexes from before the revisions and parents were kept are rebuilt
+        if index.get('mtime') != st.st_mtime or \
+        index.get('size') != st.st_size or 'revision' not in index or \
+        (index['presets'] and len(index['presets'][0]) < 5):
+            return None
+        return index
+
+    @staticmethod
+    def replay_journal():
+        """ Replay changes made since the presets file was last written.
+
+        A journal is replayed even if journaling has been disabled since, so
+        no changes are lost. Records are stamped with the revision of the
+        presets file they were made after, and records from before the file
+        was last written are skipped, as they're already in it. That's the
+        case if the journal was left behind by a crash while the journal was
+        folded into the presets file.
+        """
+        path = Presets.journal_path()
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return
+        good = 0
+        last = ''
+        stale = 0
+        for line in f:
+            try:
+                record = json.loads(line, \
+                    object_pairs_hook=collections.OrderedDict)
+            except ValueError:
+                # A record cut short by a crash, ignore it and the rest
+                break
+            # Journals from before the records were stamped are replayed
+            if isinstance(record[0], int):
+                if record.pop(0) < Presets.library:
+                    stale += 1
+                else:
+                    Presets.replay(record)
+            else:
+                Presets.replay(record)
+            good += len(line)
+            last = line
+        size = os.fstat(f.fileno()).st_size
+        f.close()
+        if stale:
+            print >>sys.stderr, 'Skipped %d records of %s that are already ' \
+                'in the presets file' % (stale, path)
+
+        # Records appended later would end up on the line of a damaged
+        # record, so the journal is cut back to the last good record. A
+        # last record that only lacks its line break gets it back.
+        try:
+            if good < size:
+                print >>sys.stderr, 'Skipped %d bytes of a damaged record ' \
+                    'at the end of %s' % (size - good, path)
+                f = open(path, 'r+b')
+                f.truncate(good)
+                f.close()
+            elif last and not last.endswith('\n'):
+                f = open(path, 'ab')
+                f.write('\n')
+                f.close()
+                good += 1
+        except IOError, e:
+            print >>sys.stderr, 'Failed to repair the journal: %s' % e
+        Presets.journaled += good
+
+    @staticmethod
+    def stamp():
+        """ Give all presets a new revision, after they've been loaded. """
+        for name in Presets.names:
+            Presets.revision += 1
+            Presets.revisions[name] = Presets.revision
+
+    @staticmethod
+    def save():
+        """ Saves the user presets.
+
+        Nothing is written if no preset has changed since the last save. With
+        the journal enabled, only the changes are appended to the journal
+        until it grows big enough to be folded back into the presets file.
+
+        The presets are handed to the writer as a snapshot, or the changes as
+        journal records, so the caller doesn't wait for them to be written.
+        """
+        if not Presets.dirty:
+            return
+
+        if SHARED_LIBRARY:
+            Library.save()
+            return
+
+        if JOURNAL_ENABLED and Presets.pending and not Writer.failed and \
+        Presets.journaled < JOURNAL_COMPACT_SIZE and \
+        (os.path.exists(Presets.file_path()) or \
+        os.path.exists(Presets.binary_path())):
+            lines = Presets.journal_lines()
+            Presets.journaled += len(lines)
+            Writer.submit(('journal', lines))
+        elif BINARY_PRESETS:
+            Presets.journaled = 0
+            snapshot = Presets.snapshot(Presets.binary_path())
+            Presets.commit(snapshot)
+            Writer.submit(('binary', snapshot))
+        else:
+            Presets.journaled = 0
+            snapshot = Presets.snapshot()
+            Presets.commit(snapshot)
+            Writer.submit(('presets', snapshot))
+
+        Presets.pending = []
+        Presets.dirty = False
+        Presets.saved_at = time.time()
+
+    @staticmethod
+    def snapshot(path=None, revision=None):
+        """ Get the presets as they are now, to be written by write_presets()
+        or BinaryPresets.write().
+
+        Parsed presets are copied, and unparsed presets are kept as their
+        location in the file they were loaded from.
+
+        @param   string  path      The file to write to, defaults to the
+                                   presets file
+        @param   int     revision  The revision to write, defaults to the one
+                                   after the last written
+
+        @return  Tuple of the presets, the path to write them to, the
+                 generation of the file they were loaded from, a list of
+                 (name, settings or location) in the order of the names, the
+                 revision to write, the revision of each preset, and the
+                 known parents of the unparsed presets.
+        """
+        if path is None:
+            path = Presets.file_path()
+
+        # Presets changed since the last write get the revision of this write
+        if revision is None:
+            revision = Presets.library + 1
+        stamps = dict(Presets.stamps)
+        for name in Presets.touched:
+            stamps[name] = revision
+
+        bodies = Presets.user['presets']
+        with bodies.lock:
+            presets = [(name, bodies.snapshot(name)) for name in Presets.names]
+            return bodies, path, bodies.generation, presets, revision, \
+                stamps, bodies.parents()
+
+    @staticmethod
+    def commit(snapshot):
+        """ Keep the revisions of a snapshot, once it's handed to be written.
+
+        @param  tuple  snapshot  The presets, as returned by snapshot()
+        """
+        Presets.library = snapshot[4]
+        Presets.stamps = snapshot[5]
+        Presets.touched = set()
+        Presets.removed = set()
+
+    @staticmethod
+    def write_presets(snapshot):
+        """ Writes all presets to a json formatted file, and removes the
+        journal which is now included in the file.
+
+        Each preset is written on a line of its own, and where it's written is
+        kept in the index, together with the preset it derives from. Presets
+        that haven't been parsed are copied as they are from the old file, or
+        decoded if they were loaded from the binary presets file.
+
+        @param  tuple  snapshot  The presets, as returned by snapshot()
+        """
+        bodies, path, generation, presets, revision, stamps, parents = snapshot
+
+        # A snapshot taken while the file was being written has the unparsed
+        # presets at their location in the file before it
+        moved = bodies.moved if generation != bodies.generation else None
+
+        # Save as json, in the current order found in the names list, to save
+        # user sorting. Written to a temporary file that replaces the old one,
+        # so a crash while writing can't truncate the presets.
+        src = None
+        f = open(path + '.tmp', 'wb')
+        f.write('{\n    "version": %s,\n    "revision": %d,\n    "presets": {' \
+            % (json.dumps(__version__), revision))
+        index = []
+        new_moved = {}
+        for row, (name, body) in enumerate(presets):
+            if row:
+                f.write(',')
+            key = name.decode('utf-8')
+            f.write('\n        %s: ' % json.dumps(key))
+            if isinstance(body, tuple):
+                offset, length = body
+                if moved is not None:
+                    offset = moved[offset]
+                if src is None:
+                    src = open(bodies.path, 'rb')
+                if bodies.path == path:
+                    src.seek(offset)
+                    data = src.read(length)
+                    new_moved[offset] = f.tell()
+                    if name in parents:
+                        parent = parents[name]
+                    elif '"parent"' in data:
+                        parent = json.loads(data).get('parent')
+                    else:
+                        parent = None
+                else:
+                    body = PresetBodies.convert( \
+                        bodies.decode((offset, length), src))
+            if not isinstance(body, tuple):
+                data = json.dumps(body.sparse(), separators=(', ', ': '))
+                parent = getattr(body, 'parent', None)
+            index.append([key, f.tell(), len(data), stamps.get(name, 0), \
+                parent])
+            f.write(data)
+        f.write('\n    }\n}\n')
+        f.close()
+        if src:
+            src.close()
+
+        # Unparsed presets are now found at their new location
+        with bodies.lock:
+            Presets.replace_file(path + '.tmp', path)
+            if bodies.path == path:
+                bodies.relocate(new_moved)
+
+        journal = os.path.join(os.path.dirname(path), JOURNAL_FILE)
+        if os.path.exists(journal):
+            os.remove(journal)
+
+        st = os.stat(path)
+        Presets.written += st.st_size
+        index = {
+            'mtime': st.st_mtime,
+            'size': st.st_size,
+            'revision': revision,
+            'presets': index
+        }
+        index_path = os.path.join(os.path.dirname(path), PRESETS_INDEX)
+        try:
+            f = open(index_path + '.tmp', 'w')
+            json.dump(index, f, separators=(',', ':'))
+            f.close()
+            Presets.replace_file(index_path + '.tmp', index_path)
+        except (IOError, OSError):
+            # Without the index the presets are just loaded in full
+            pass
+
+    @staticmethod
+    def journal_lines():
+        """ @return The pending change records, as lines for the journal,
+                    stamped with the revision of the presets file """
+        return ''.join(json.dumps((Presets.library,) + record, \
+            separators=(',', ':'), default=lambda body: body.sparse()) + \
+            '\n' for record in Presets.pending)
+
+    @staticmethod
+    def write_journal(lines):
+        """ Appends change records to the journal.
+
+        @param  string  lines  The records, as returned by journal_lines()
+        """
+        f = open(Presets.journal_path(), 'a')
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        Presets.written += len(lines)
+
+    @staticmethod
+    def record(*record):
+        """ Keep a change record for the journal.
+
+        @param   mixed  record  The operation followed by its arguments
+        """
+        if JOURNAL_ENABLED:
+            Presets.pending.append(record)
+
+    @staticmethod
+    def replay(record):
+        """ Apply a change record from the journal to the presets.
+
+        Records that no longer apply, like the delete of a preset that isn't
+        there, are ignored, so replaying a record that's already in the
+        presets leaves them as they are.
+
+        @param   list  record  The operation followed by its arguments
+        """
+        op = record[0]
+        presets = Presets.user['presets']
+        names = Presets.names
+
+        if op == 'add':
+            name = record[1].encode('utf-8')
+            presets[name] = record[2]
+            if name not in names:
+                names.append(name)
+            Presets.touched.add(name)
+        elif op == 'delete':
+            name = record[1].encode('utf-8')
+            if name not in names:
+                return
+            del presets[name]
+            names.remove(name)
+            Presets.touched.discard(name)
+            Presets.removed.add(name)
+        elif op == 'rename':
+            old_name = record[1].encode('utf-8')
+            new_name = record[2].encode('utf-8')
+            if old_name not in names or new_name in names:
+                return
+            presets.rename(old_name, new_name)
+            names[names.index(old_name)] = new_name
+            Presets.touched.discard(old_name)
+            Presets.removed.add(old_name)
+            Presets.touched.add(new_name)
+        elif op == 'move':
+            if max(record[1], record[2]) < len(names):
+                names.move(record[1], record[2])
+        elif op in ('set', 'body'):
+            name = record[1].encode('utf-8')
+            if name not in names:
+                return
+            if op == 'set':
+                presets[name][record[2]] = record[3]
+            else:
+                presets[name] = record[2]
+            Presets.touched.add(name)
+
+    @staticmethod
+    def request_save():
+        """ Saves pending changes, unless a save was just made.
+
+        Changes made within SAVE_INTERVAL of the last save are left pending,
+        to be written by a later request, by an explicit save(), or when
+        Python exits.
+        """
+        if Presets.dirty and time.time() - Presets.saved_at >= SAVE_INTERVAL:
+            Presets.save()
+
+    @staticmethod
+    def exit():
+        """ Save the changes still pending, and stop the writer thread once
+        they're written, when Python exits.
+        """
+        if Presets.dirty and Presets.user is not None:
+            try:
+                Presets.save()
+            except (IOError, OSError), e:
+                print >>sys.stderr, 'Failed to save the presets: %s' % e
+        Writer.stop()
+
+    @staticmethod
+    def file_path():
+        """ @return Absolute path to the presets file """
+        # In LightWave the path is set to the file in LightWave's config folder
+        if Presets.path is None:
+            return os.path.abspath(PRESETS_FILE)
+        return Presets.path
+
+    @staticmethod
+    def journal_path():
+        """ @return Absolute path to the presets journal """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, JOURNAL_FILE)
+
+    @staticmethod
+    def index_path():
+        """ @return Absolute path to the presets index """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, PRESETS_INDEX)
+
+    @staticmethod
+    def lock_path():
+        """ @return Absolute path to the lock file of a shared library """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, PRESETS_LOCK)
+
+    @staticmethod
+    def binary_path():
+        """ @return Absolute path to the binary presets file """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, PRESETS_BINARY)
+
+    @staticmethod
+    def replace_file(src, dest):
+        """ Move a file in place over another file.
+
+        @param   string  src   Path to the new file
+        @param   string  dest  Path to the file to replace
+        """
+        try:
+            os.rename(src, dest)
+        except OSError:
+            # Windows won't rename over an existing file
+            os.remove(dest)
+            os.rename(src, dest)
+
+    @staticmethod
+    def add(name):
+        """ Adds a new preset.
+
+        @param   string  name  The name of the preset to add.
+        @return  False if failed to add
+        """
+        # Check so we got a unique name
+        if name in Presets.names:
+            return False
+
+        # Add the new preset to list of names and to definitions. A new record
+        # has the default values, where sections are disabled and the controls
+        # get their default value from the definitions.
+        Presets.names.append(name)
+        Presets.user['presets'][name] = Record(Presets.definitions)
+        Presets.record('add', name, Presets.user['presets'][name])
+        Presets.changed(name)
+        Presets.request_save()
+
+    @staticmethod
+    def delete(row):
+        """ Delete a preset.
+
+        @param   int    row       The row in the list to rename
+
+        @return  False if failed to delete
+        """
+        # Get name of preset to delete
+        name = Presets.get_name(row)
+
+        if name == False:
+            return False
+
+        # Presets derived from it gets all their values of their own
+        presets = Presets.user['presets']
+        for child in presets.children(name):
+            presets[child] = presets[child].flatten()
+            Presets.record('body', child, presets[child])
+            Presets.changed(child)
+
+        # Remove from ordereddict and list of names
+        del Presets.user['presets'][name]
+        Presets.names.remove(name)
+        Presets.revisions.pop(name, None)
+        Presets.stamps.pop(name, None)
+        Presets.touched.discard(name)
+        Presets.removed.add(name)
+        Presets.record('delete', name)
+        Presets.changed()
+
+    @staticmethod
+    def rename(row, new_name):
+        """ Rename a preset.
+
+        @param   int    row       The row in the list to rename
+        @param   string new_name  The new name of the preset
+
+        @return  False if failed to rename
+        """
+        # Get the old name
+        old_name = Presets.get_name(row)
+
+        # If the new name is the same as the old, silently return
+        if old_name == new_name:
+            return False
+
+        # Check so we got a unique name
+        if new_name in Presets.names:
+            return False
+
+        # Move the preset to the new name
+        Presets.user['presets'].rename(old_name, new_name)
+
+        # Also update the list of names
+        Presets.names[row] = new_name
+
+        Presets.revisions[new_name] = Presets.revisions.pop(old_name, 0)
+        Presets.stamps.pop(old_name, None)
+        Presets.touched.discard(old_name)
+        Presets.removed.add(old_name)
+        Presets.record('rename', old_name, new_name)
+        Presets.changed(new_name)
+
+        # Presets derived from it follows it to the new name
+        presets = Presets.user['presets']
+        for child in presets.children(old_name):
+            presets[child].parent = new_name
+            Presets.record('body', child, presets[child])
+            Presets.changed(child)
+
+    @staticmethod
+    def duplicate(row):
+        """ Duplicate a preset.
+
+        @param   int    row       The row in the list to rename
+
+        @return  False if failed to duplicate
+        """
+        if row < 0 or row >= len(Presets.names):
+            return False
+
+        # Get the old name
+        src_name = Presets.get_name(row)
+
+        # Generate the destination name
+        dest_name = Presets.names.unique(src_name + ' - Copy %s', 2, \
+            src_name + ' - Copy')
+
+        # Derive the new preset from the old, and add the new name to the
+        # list of names. It shares all values with the old preset until
+        # they're changed in either of them.
+        Presets.user['presets'][dest_name] = Derived(src_name)
+        Presets.names.append(dest_name)
+        Presets.record('add', dest_name, Presets.user['presets'][dest_name])
+        Presets.changed(dest_name)
+
+    @staticmethod
+    def move(row, new_row):
+        """ Move a preset to a new position in the list.
+
+        @param   int    row       The row in the list to move
+        @param   int    new_row   The row to move it to
+        """
+        Presets.names.move(row, new_row)
+        Presets.record('move', row, new_row)
+        Presets.changed()
+
+    @staticmethod
+    def set(name, key, value):
+        """ Set a value in a preset, and mark it as changed if it differs.
+
+        @param   string  name   The name of the preset
+        @param   string  key    The command or section id to set
+        @param   mixed   value  The new value
+
+        @return  True if the value was changed
+        """
+        settings = Presets.user['presets'][name]
+        if key in settings and Presets.same(settings[key], value):
+            return False
+
+        settings[key] = value
+        Presets.record('set', name, key, value)
+        Presets.changed(name)
+        return True
+
+    @staticmethod
+    def changed(name=None):
+        """ Flag that presets needs to be saved.
+
+        @param   string  name  The preset that changed, None if only the list
+                               of presets changed.
+        """
+        if name is not None:
+            Presets.revision += 1
+            Presets.revisions[name] = Presets.revision
+            Presets.touched.add(name)
+            Presets.removed.discard(name)
+        Presets.dirty = True
+
+    # --------------------------------------------------------------------------
+    # Helpers
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def lineage(name):
+        """ Get the revisions of a preset and the presets it derives from.
+
+        @param   string  name  The name of the preset
+
+        @return  Tuple of revisions, empty if the preset doesn't exist or
+                 derives from itself
+        """
+        presets = Presets.user['presets']
+        lineage = []
+        seen = set()
+        while name is not None and name in presets:
+            if name in seen:
+                return ()
+            seen.add(name)
+            lineage.append(Presets.revisions.get(name))
+            name = getattr(presets[name], 'parent', None)
+        return tuple(lineage)
+
+    @staticmethod
+    def get_name(row):
+        """ Return the name, or False if the row doesn't exist.
+
+        @param   int  row  The row in the list to retrieve
+
+        @return  False if no name was found.
+        """
+        if row < 0 or row >= len(Presets.names):
+            return False
+
+        return Presets.names[row]
+
+    @staticmethod
+    def same(a, b):
+        """ Compare two setting values.
+
+        Floats are compared with a small tolerance, as values that makes a
+        round trip through the controls (like angles converted to radians and
+        back) rarely come back bit identical.
+
+        @return  True if the values are considered equal
+        """
+        if isinstance(a, float) or isinstance(b, float):
+            try:
+                return abs(a - b) <= 1e-9 * max(1.0, abs(a), abs(b))
+            except TypeError:
+                return False
+        return a == b
+
+    @staticmethod
+    def get_tab_name(index):
+        """ Return the tab name, or False if the tab doesn't exist.
+
+        @param   int  index  The index of the tab to retrieve
+
+        @return  False if no name was found, else the name as string.
+        """
+        names = Presets.definitions.tab_names
+
+        # Return False if index out of list scope
+        if index < 0 or index >= len(names):
+            return False
+
+        return names[index]
+
+
+# ------------------------------------------------------------------------------
+# Binary Presets Class
+# ------------------------------------------------------------------------------
+class BinaryPresets:
+    """ Reads and writes the presets in a compact binary format.
+
+    The file starts with a header and the schema of the records, which is the
+    slots and defaults of the definitions they were written with. It's
+    followed by the preset names, and a table with a fixed width record per
+    preset. A record holds the arrays of a Record as they are in memory, and
+    the location of a json blob, with the comment and the settings unknown
+    to the definitions, or the parent and overrides of a derived preset.
+
+    Records are decoded when first used, and copied as they are to the next
+    file if they haven't been used.
+    """
+    MAGIC = 'JSRPBIN\0'
+    # Version of the format, bumped when the layout changes
+    VERSION = 1
+    # Magic, version and schema length
+    HEADER = struct.Struct('<8sHI')
+    # Number of presets
+    COUNT = struct.Struct('<I')
+    # Kind of record, blob offset and blob length, before the arrays
+    RECORD = struct.Struct('<BII')
+    # Kinds of records
+    PLAIN, DERIVED = range(2)
+    # Bytes per value in the int and float arrays
+    INT_SIZE = array.array('i').itemsize
+    FLOAT_SIZE = array.array('d').itemsize
+
+    @staticmethod
+    def schema(definitions):
+        """ @return The schema of records written with the definitions """
+        return {
+            'version': __version__,
+            'byteorder': sys.byteorder,
+            'slots': [[key, kind, i] for key, (kind, i) in \
+                definitions.slots.iteritems() if kind != Record.COMMENT],
+            'defaults': [definitions.slot_defaults[kind].tolist() for kind in \
+                (Record.FLAG, Record.INT, Record.FLOAT)]
+        }
+
+    @staticmethod
+    def native(schema):
+        """ @return True if the schema has the layout of the definitions """
+        current = BinaryPresets.schema(Presets.definitions)
+        return schema['byteorder'] == current['byteorder'] and \
+            json.dumps([schema['slots'], schema['defaults']]) == \
+            json.dumps([current['slots'], current['defaults']])
+
+    @staticmethod
+    def load():
+        """ Loads the preset names and the location of their records from the
+        binary presets file, if it was written after the presets file.
+
+        When both files have the same modification time, the binary file is
+        only used with BINARY_PRESETS enabled.
+
+        @return  False if the binary file wasn't used
+        """
+        path = Presets.binary_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        try:
+            mtime = os.stat(Presets.file_path()).st_mtime
+            if mtime > st.st_mtime or \
+            (mtime == st.st_mtime and not BINARY_PRESETS):
+                return False
+        except OSError:
+            pass
+
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            return False
+        try:
+            magic, version, length = \
+                BinaryPresets.HEADER.unpack(f.read(BinaryPresets.HEADER.size))
+            if magic != BinaryPresets.MAGIC or version != BinaryPresets.VERSION:
+                return False
+            schema = json.loads(f.read(length))
+            bodies = BinaryBodies(path, schema)
+            count, = BinaryPresets.COUNT.unpack(f.read(BinaryPresets.COUNT.size))
+
+            lengths = array.array('I')
+            lengths.fromfile(f, count)
+            if schema['byteorder'] != sys.byteorder:
+                lengths.byteswap()
+            data = f.read(sum(lengths))
+
+            width = bodies.ends[-1]
+            offset = f.tell()
+            pos = 0
+            names = []
+            locations = []
+            for length in lengths:
+                name = data[pos:pos + length]
+                names.append(name)
+                locations.append((name, offset, width))
+                pos += length
+                offset += width
+            if pos != len(data) or os.fstat(f.fileno()).st_size < offset:
+                return False
+
+            # Records with another layout are decoded right away, as they
+            # can't be copied to the next file as they are
+            bodies.locate(locations)
+            if not LAZY_LOAD or not bodies.native:
+                for name, offset, width in locations:
+                    bodies[name] = bodies.decode((offset, width), f)
+        except (struct.error, ValueError, KeyError, EOFError):
+            return False
+        finally:
+            f.close()
+
+        Presets.user['presets'] = bodies
+        Presets.library = schema.get('revision', 0)
+        for name in names:
+            Presets.names.append(name)
+        return True
+
+    @staticmethod
+    def encode(body, blob_offset, defaults):
+        """ Encode the settings of a preset as a record.
+
+        @param   mixed   body         The Record or Derived to encode
+        @param   int     blob_offset  Where the blob is written in the file
+        @param   string  defaults     The arrays of the default values, for
+                                      derived presets
+
+        @return  Tuple of the record and the blob
+        """
+        if isinstance(body, Derived):
+            blob = json.dumps(body.sparse(), separators=(', ', ': '))
+            return BinaryPresets.RECORD.pack(BinaryPresets.DERIVED, \
+                blob_offset, len(blob)) + defaults, blob
+
+        blob = ''
+        if body.comment or body.extra:
+            values = collections.OrderedDict()
+            if body.comment:
+                values['comment'] = body.comment
+            if body.extra:
+                values.update(body.extra)
+            blob = json.dumps(values, separators=(', ', ': '))
+        return BinaryPresets.RECORD.pack(BinaryPresets.PLAIN, \
+            blob_offset, len(blob)) + body.flags.tostring() + \
+            body.ints.tostring() + body.floats.tostring(), blob
+
+    @staticmethod
+    def write(snapshot):
+        """ Writes all presets to the binary presets file, and removes the
+        journal which is now included in the file.
+
+        Presets that haven't been parsed are copied as they are from the old
+        file, if it has the same schema, or else decoded and encoded again.
+
+        @param  tuple  snapshot  The presets, as returned by Presets.snapshot()
+        """
+        bodies, path, generation, presets, revision, stamps, parents = \
+            snapshot
+        moved = bodies.moved if generation != bodies.generation else None
+        copy = isinstance(bodies, BinaryBodies) and bodies.path == path and \
+            bodies.native
+
+        definitions = Presets.definitions
+        schema = BinaryPresets.schema(definitions)
+        schema['revision'] = revision
+        schema = json.dumps(schema)
+        defaults = definitions.slot_defaults
+        defaults = defaults[Record.FLAG].tostring() + \
+            defaults[Record.INT].tostring() + defaults[Record.FLOAT].tostring()
+        width = BinaryPresets.RECORD.size + len(defaults)
+
+        names = [name for name, body in presets]
+        lengths = array.array('I', [len(name) for name in names])
+        table_offset = BinaryPresets.HEADER.size + len(schema) + \
+            BinaryPresets.COUNT.size + len(lengths) * lengths.itemsize + \
+            sum(lengths)
+        blob_offset = table_offset + len(presets) * width
+
+        # The old file is mapped, so records can be copied as slices of it
+        src = None
+        records = []
+        blobs = []
+        new_moved = {}
+        for row, (name, body) in enumerate(presets):
+            if isinstance(body, tuple):
+                offset, length = body
+                if moved is not None:
+                    offset = moved[offset]
+                if src is None:
+                    f = open(bodies.path, 'rb')
+                    src = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    f.close()
+                if copy:
+                    kind, old_offset, blob_length = \
+                        BinaryPresets.RECORD.unpack_from(src, offset)
+                    blob = src[old_offset:old_offset + blob_length]
+                    record = BinaryPresets.RECORD.pack(kind, blob_offset, \
+                        blob_length) + \
+                        src[offset + BinaryPresets.RECORD.size:offset + length]
+                    new_moved[offset] = table_offset + row * width
+                else:
+                    body = PresetBodies.convert( \
+                        bodies.decode((offset, length), src))
+            if not isinstance(body, tuple):
+                record, blob = BinaryPresets.encode(body, blob_offset, defaults)
+            records.append(record)
+            blobs.append(blob)
+            blob_offset += len(blob)
+        if src:
+            src.close()
+
+        # Written to a temporary file that replaces the old one, so a crash
+        # while writing can't truncate the presets.
+        f = open(path + '.tmp', 'wb')
+        f.write(BinaryPresets.HEADER.pack(BinaryPresets.MAGIC, \
+            BinaryPresets.VERSION, len(schema)))
+        f.write(schema)
+        f.write(BinaryPresets.COUNT.pack(len(presets)))
+        lengths.tofile(f)
+        f.write(''.join(names))
+        f.write(''.join(records))
+        f.write(''.join(blobs))
+        f.close()
+
+        # Unparsed presets are now found at their new location
+        with bodies.lock:
+            Presets.replace_file(path + '.tmp', path)
+            if copy:
+                bodies.relocate(new_moved)
+
+        journal = os.path.join(os.path.dirname(path), JOURNAL_FILE)
+        if os.path.exists(journal):
+            os.remove(journal)
+        Presets.written += os.path.getsize(path)
+
+
+# ------------------------------------------------------------------------------
+# Writer Class
+# ------------------------------------------------------------------------------
+class Writer:
+    """ Writes the presets on a background thread.
+
+    Jobs are written in the order they're submitted. Jobs waiting to be
+    written are coalesced, where a snapshot of all presets replaces the jobs
+    before it, and journal records are added to the journal records before
+    them.
+    """
+    # ('presets', snapshot), ('binary', snapshot) and ('journal', lines) jobs
+    # waiting to be written
+    queue = []
+    # True while a job is being written
+    busy = False
+    # True if a write failed, until all presets have been written again
+    failed = False
+    # True when the thread should stop, once the queue is written
+    stopping = False
+    thread = None
+    condition = threading.Condition()
+
+    @staticmethod
+    def submit(job):
+        """ Hand a job to the writer thread, or write it right away if saves
+        aren't asynchronous.
+
+        @param  tuple  job  The kind of job and its data
+        """
+        if not ASYNC_SAVE:
+            Writer.write(job)
+            return
+
+        with Writer.condition:
+            if job[0] != 'journal':
+                Writer.queue = [job]
+            elif Writer.queue and Writer.queue[-1][0] == 'journal':
+                Writer.queue[-1] = ('journal', Writer.queue[-1][1] + job[1])
+            else:
+                Writer.queue.append(job)
+
+            if Writer.thread is None:
+                Writer.stopping = False
+                Writer.thread = threading.Thread(target=Writer.run)
+                Writer.thread.daemon = True
+                Writer.thread.start()
+            Writer.condition.notify_all()
+
+    @staticmethod
+    def flush():
+        """ Wait for all submitted jobs to be written. """
+        with Writer.condition:
+            while Writer.queue or Writer.busy:
+                Writer.condition.wait()
+
+    @staticmethod
+    def stop():
+        """ Write all submitted jobs, and stop the writer thread. """
+        with Writer.condition:
+            thread = Writer.thread
+            if thread is None:
+                return
+            Writer.stopping = True
+            Writer.condition.notify_all()
+        thread.join()
+        Writer.thread = None
+
+    @staticmethod
+    def run():
+        """ Write jobs as they're submitted, on the writer thread, until
+        stopped.
+        """
+        while True:
+            with Writer.condition:
+                while not Writer.queue and not Writer.stopping:
+                    Writer.condition.wait()
+                if not Writer.queue:
+                    return
+                job = Writer.queue.pop(0)
+                Writer.busy = True
+            try:
+                Writer.write(job)
+            finally:
+                with Writer.condition:
+                    Writer.busy = False
+                    Writer.condition.notify_all()
+
+    @staticmethod
+    def write(job):
+        """ Write a job.
+
+        If it fails, the presets are marked as changed, so they're written
+        in full by the next save.
+
+        @param  tuple  job  The kind of job and its data
+        """
+        kind, data = job
+        try:
+            if kind == 'presets':
+                Presets.write_presets(data)
+                Writer.failed = False
+            elif kind == 'binary':
+                BinaryPresets.write(data)
+                Writer.failed = False
+            else:
+                Presets.write_journal(data)
+        except (IOError, OSError), e:
+            print >>sys.stderr, 'Failed to save the presets: %s' % e
+            Writer.failed = True
+            Presets.dirty = True
+
+
+# ------------------------------------------------------------------------------
+# Library Class
+# ------------------------------------------------------------------------------
+class Library:
+    """ Keeps a presets file shared between sessions consistent.
+
+    Sessions take turns through an advisory lock on a file next to the
+    presets file. Before a session writes, and when the panel opens, it checks
+    if another session has written the presets file since it last looked,
+    first by its stat and then by the revision stamped in it. If so, only the
+    presets written with a later revision than the last one seen are read,
+    from their location in the index, and merged with the presets changed
+    here. Changes made here win over changes to the same preset made by other
+    sessions.
+    """
+
+    @staticmethod
+    @contextlib.contextmanager
+    def locked():
+        """ Hold the lock on the presets file, for a with statement. Nothing
+        is locked unless SHARED_LIBRARY is enabled.
+        """
+        if not SHARED_LIBRARY:
+            yield
+            return
+
+        # Only one of them exists, depending on the platform
+        f = open(Presets.lock_path(), 'a+')
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+            f.close()
+
+    @staticmethod
+    def load():
+        """ Loads all presets, and the revision each was written with, from
+        the presets file. Has to be called while holding the lock.
+        """
+        Presets.load_json()
+        index = Presets.read_index()
+        if index is not None and index['revision'] == Presets.library:
+            for s, offset, length, stamp, parent in index['presets']:
+                Presets.stamps[s.encode('utf-8')] = stamp
+        Presets.synced = Library.stat()
+
+    @staticmethod
+    def save():
+        """ Saves the presets, after merging the presets other sessions have
+        saved.
+
+        The file is written right away while holding the lock, instead of by
+        the writer thread, so no other session can write in between.
+        """
+        Writer.flush()
+        with Library.locked():
+            Library.sync()
+            snapshot = Presets.snapshot()
+            Writer.write(('presets', snapshot))
+            if Writer.failed:
+                return
+            Presets.commit(snapshot)
+            Presets.synced = Library.stat()
+
+        Presets.pending = []
+        Presets.dirty = False
+        Presets.saved_at = time.time()
+
+    @staticmethod
+    def refresh():
+        """ Merge the presets other sessions have saved, in shared mode.
+
+        @return  True if the presets changed
+        """
+        if not SHARED_LIBRARY:
+            return False
+        with Library.locked():
+            return Library.sync()
+
+    @staticmethod
+    def sync():
+        """ Merge the presets other sessions have saved since the presets
+        file was last read or written. Has to be called while holding the
+        lock.
+
+        @return  True if the presets changed
+        """
+        stat = Library.stat()
+        if stat is None or stat == Presets.synced:
+            return False
+
+        path = Presets.file_path()
+        revision = Library.revision(path)
+        if revision == Presets.library:
+            Presets.synced = stat
+            return False
+
+        # The presets in the file, as (name, revision, location). Without an
+        # index every preset is read, as if they all had changed.
+        presets = Presets.user['presets']
+        f = open(path, 'rb')
+        try:
+            index = Presets.read_index()
+            if index is not None and index['revision'] == revision:
+                remote = [(s.encode('utf-8'), stamp, (offset, length)) \
+                    for s, offset, length, stamp, parent in index['presets']]
+            else:
+                data = json.load(f, object_pairs_hook=collections.OrderedDict)
+                remote = [(s.encode('utf-8'), revision, body) \
+                    for s, body in data['presets'].iteritems()]
+
+            for name, stamp, body in remote:
+                if name in Presets.touched or name in Presets.removed or \
+                (name in presets and stamp <= Presets.library):
+                    continue
+                if isinstance(body, tuple):
+                    body = presets.decode(body, f)
+                presets[name] = body
+                Presets.stamps[name] = stamp
+                Presets.revision += 1
+                Presets.revisions[name] = Presets.revision
+        finally:
+            f.close()
+
+        # Presets removed by other sessions are removed here too, unless
+        # they've been changed here. The presets keep their order, and the
+        # presets added by other sessions are added last.
+        found = set(name for name, stamp, body in remote)
+        names = []
+        gone = []
+        for name in Presets.names:
+            if name in found or name in Presets.touched:
+                names.append(name)
+            else:
+                gone.append(name)
+
+        # Presets here derived from a removed preset gets all their values of
+        # their own, like when it's deleted here. All of them are flattened
+        # before any is removed, so they can still be resolved.
+        for name in gone:
+            for child in presets.children(name):
+                if child in found or child in Presets.touched:
+                    presets[child] = presets[child].flatten()
+                    Presets.record('body', child, presets[child])
+                    Presets.changed(child)
+        for name in gone:
+            del presets[name]
+            Presets.revisions.pop(name, None)
+            Presets.stamps.pop(name, None)
+        known = set(Presets.names)
+        names.extend(name for name, stamp, body in remote \
+            if name not in known and name not in Presets.removed)
+        if names != list(Presets.names):
+            Presets.names = NameIndex(names)
+
+        Presets.library = revision
+        Presets.synced = stat
+        return True
+
+    @staticmethod
+    def stat():
+        """ @return The (mtime, size, inode) of the presets file, or None """
+        try:
+            st = os.stat(Presets.file_path())
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size, st.st_ino
+
+    @staticmethod
+    def revision(path):
+        """ Read the revision stamped in the head of a presets file.
+
+        @param   string  path  Path to the presets file
+
+        @return  The revision, or 0 for files from before revisions were kept
+        """
+        try:
+            f = open(path, 'rb')
+            head = f.read(256)
+            f.close()
+        except IOError:
+            return 0
+
+        head = head.split('"presets"', 1)[0]
+        start = head.find('"revision":')
+        if start < 0:
+            return 0
+        try:
+            return int(head[start + len('"revision":'):].split(',', 1)[0])
+        except ValueError:
+            return 0
+
+
+# ------------------------------------------------------------------------------
+# Servers Class
+# ------------------------------------------------------------------------------
+class Servers:
+    """ Where master plugins are found in LightWave's MasterHandler list.
+
+    The index of a server is kept between lookups, and checked with a single
+    query before it's used. The list is only scanned when the server has
+    moved, which happens when a server before it is removed.
+
+    Each instance of the master plugin keeps the index of its own server, as
+    the list holds a server per instance, all with the same name. The index
+    is recorded when the button adds the server and the instance is created,
+    and moved down when a server before it is removed.
+    """
+    CLASS = 'MasterHandler'
+    # Index by server name
+    index = {}
+    # Index of the server of each plugin instance, by instance
+    instances = {}
+    # Index the next added server gets, found by the last scan
+    free = None
+    # Index of the server the button added, until its instance is created
+    added = None
+
+    @staticmethod
+    def find(name, query):
+        """ Find a server in the MasterHandler list.
+
+        @param   string    name   The name of the server
+        @param   function  query  Returns the name of the server at an index,
+                                  or None past the end of the list. Like
+                                  LWItemInfo.server() for MasterHandler.
+
+        @return  The index of the server, or None if it's not added
+        """
+        index = Servers.index.get(name)
+        if index is not None and query(index) == name:
+            return index
+
+        index = 1
+        while True:
+            server = query(index)
+            if server is None:
+                Servers.index.pop(name, None)
+                Servers.free = index
+                return None
+            if server == name:
+                Servers.index[name] = index
+                return index
+            index += 1
+
+    @staticmethod
+    def own(instance, name, query):
+        """ Find the server of a plugin instance in the MasterHandler list.
+
+        If the index kept for the instance no longer holds a server with its
+        name, the list is scanned for the servers with the name. Servers keep
+        their order when others are removed, so if there's one for each
+        instance that keeps an index, they're matched in order. Otherwise the
+        server is only found if it's the one server no other instance holds,
+        so the server of another instance is never returned.
+
+        @param   object    instance  The plugin instance
+        @param   string    name      The name of the server
+        @param   function  query     Like for find()
+
+        @return  The index of the server, or None if it can't be told apart
+        """
+        index = Servers.instances.get(instance)
+        if index is not None and query(index) == name:
+            return index
+
+        found = []
+        index = 1
+        while True:
+            server = query(index)
+            if server is None:
+                break
+            if server == name:
+                found.append(index)
+            index += 1
+
+        instances = sorted(Servers.instances, key=Servers.instances.get)
+        if instance in Servers.instances and len(found) == len(instances):
+            for other, index in zip(instances, found):
+                Servers.instances[other] = index
+            return Servers.instances[instance]
+
+        held = set(i for other, i in Servers.instances.iteritems() \
+            if other is not instance)
+        free = [i for i in found if i not in held]
+        if len(free) != 1:
+            Servers.instances.pop(instance, None)
+            return None
+        Servers.instances[instance] = free[0]
+        return free[0]
+
+    @staticmethod
+    def add(name, index):
+        """ Keep the index of a server that has been added. """
+        Servers.index[name] = index
+        Servers.added = index
+
+    @staticmethod
+    def created(instance):
+        """ Give a plugin instance the index of the server the button added
+        for it, if any.
+
+        @param  object  instance  The plugin instance
+        """
+        if Servers.added is not None:
+            Servers.instances[instance] = Servers.added
+            Servers.added = None
+
+    @staticmethod
+    def remove(name, index):
+        """ Forget a server that has been removed, and move the servers after
+        it down.
+
+        @param  string  name   The name of the server
+        @param  int     index  The index it was removed from
+        """
+        if Servers.index.get(name) == index:
+            del Servers.index[name]
+        for key, i in Servers.index.items():
+            if i > index:
+                Servers.index[key] = i - 1
+        for instance, i in Servers.instances.items():
+            if i == index:
+                del Servers.instances[instance]
+            elif i > index:
+                Servers.instances[instance] = i - 1
+        if Servers.free is not None and Servers.free > index:
+            Servers.free -= 1
+
+
+# ------------------------------------------------------------------------------
+# Stats Class
+# ------------------------------------------------------------------------------
+class Stats:
+    """ Timing of the hot paths.
+
+    Functions are timed by replacing them with a wrapper, which is only done
+    when the stats are enabled. The totals are kept per function as calls,
+    cumulative and max time in seconds, and bytes written to disk.
+    """
+    # [calls, total, max, bytes] by the name of the timed function
+    totals = collections.OrderedDict()
+
+    @staticmethod
+    def instrument(owner, attr, name=None):
+        """ Replace a function with a timed wrapper.
+
+        @param  mixed   owner  The class or module with the function
+        @param  string  attr   The name of the function
+        @param  string  name   The name to keep the totals by, defaults to
+                               attr
+        """
+        if name is None:
+            name = attr
+        fn = owner.__dict__[attr]
+        static = isinstance(fn, staticmethod)
+        if static:
+            fn = fn.__func__
+        if getattr(fn, 'timed', False):
+            return
+
+        # Only needed when timing, so not imported with the module
+        import functools
+
+        totals = Stats.totals.setdefault(name, [0, 0.0, 0.0, 0])
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            written = Presets.written
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                totals[0] += 1
+                totals[1] += elapsed
+                totals[2] = max(totals[2], elapsed)
+                totals[3] += Presets.written - written
+        timed.timed = True
+
+        setattr(owner, attr, staticmethod(timed) if static else timed)
+
+    @staticmethod
+    def report():
+        """ @return List of lines with the totals of the called functions """
+        lines = []
+        for name, (calls, total, longest, written) in Stats.totals.iteritems():
+            if not calls:
+                continue
+            line = '%s: %d calls, %.1f ms total, %.1f ms max' % \
+                (name, calls, total * 1000, longest * 1000)
+            if written:
+                line += ', %d bytes' % written
+            lines.append(line)
+        return lines
+
+    @staticmethod
+    def log_path():
+        """ @return Absolute path to the stats log """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, STATS_LOG)
+
+    @staticmethod
+    def write_log():
+        """ Append the totals to the stats log.
+
+        When the log has grown past STATS_LOG_SIZE, it's kept as a backup and
+        a new log is started.
+        """
+        lines = Stats.report()
+        if not lines:
+            return
+
+        path = Stats.log_path()
+        try:
+            if os.path.getsize(path) >= STATS_LOG_SIZE:
+                Presets.replace_file(path, path + '.1')
+        except OSError:
+            pass
+
+        try:
+            f = open(path, 'a')
+            f.write('%s\n' % time.strftime('%Y-%m-%d %H:%M:%S'))
+            for line in lines:
+                f.write('    %s\n' % line)
+            f.close()
+        except IOError:
+            pass
+
+
+# ------------------------------------------------------------------------------
+# Apply Plans
+# ------------------------------------------------------------------------------
+# An operation in an apply plan. Sends the command, with arg unless it's None.
+# If probe is set, it's a Probe to read from the scene, and the command is
+# skipped if the scene already has state, in the units the scene reports.
+Operation = collections.namedtuple('Operation', 'command arg probe state')
+
+# A value to read from the scene. The attribute of the info class is called
+# with args, as names of scene values like 'camera' and 'time', unless args is
+# None. If index isn't None, that item of the result is read, and if flag is
+# set, the render option flag of it.
+Probe = collections.namedtuple('Probe', 'info attr args index flag')
+
+
+class Plans:
+    """ Compiles presets into plans of the operations that applies them.
+
+    Plans only depend on the preset and the definitions, so they are cached
+    per preset revision and can be inspected without touching the scene.
+    """
+    # Compiled plans by preset name, with the revision they were compiled at
+    cache = {}
+    # A probe in the definitions, like LWBackdropInfo.color(time)[0]
+    PROBE = re.compile(r'^(\w+)\.(\w+)(?:\(([\w, ]*)\))?(?:\[(\d+)\])?$')
+
+    @staticmethod
+    def plan(name):
+        """ Get the apply plan for a preset.
+
+        @param   string  name  The name of the preset
+
+        @return  Tuple of Operations
+        """
+        key = (Presets.lineage(name), Presets.definitions)
+        cached = Plans.cache.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        plan = Plans.compile(Presets.user['presets'][name].resolve())
+        Plans.cache[name] = (key, plan)
+        return plan
+
+    @staticmethod
+    def compile(settings):
+        """ Compile preset settings into a plan.
+
+        @param   dict  settings  The settings of a preset
+
+        @return  Tuple of Operations
+        """
+        plan = []
+
+        # Loop sections
+        for k, v in Presets.definitions.sections.iteritems():
+            # If section is enabled, apply the commands in the section
+            if settings[k] != True:
+                continue
+
+            # Loop commands in section
+            for ctl in v['controls']:
+                cmd = ctl['command']
+                val = settings[cmd]
+
+                if Plans.gi_tab_logic(settings, cmd) == False:
+                    continue
+
+                if Plans.fx_tab_logic(settings, cmd) == False:
+                    continue
+
+                if Plans.cam_tab_logic(settings, cmd) == False:
+                    continue
+
+                # Handle buttons that just toggles their state which can
+                # not by command be set to a specific state.
+                if ctl.get('mode') == 'toggle':
+                    plan.append(Operation(cmd, None, Plans.probe(ctl), \
+                        val == True))
+                else:
+                    arg = ctl['codec'].arg(ctl, val)
+                    plan.append(Operation(cmd, arg, Plans.probe(ctl), \
+                        ctl['codec'].scene(ctl, val)))
+
+                if cmd == 'EnableRadiosity' and val == False:
+                    break
+
+        return tuple(plan)
+
+    @staticmethod
+    def probe(ctl):
+        """ Get how the setting of a control is read back from the scene.
+
+        Controls with a render option flag are read from the render options,
+        and others from their probe in the definitions.
+
+        @param   dict  ctl  The control from the definitions
+
+        @return  A Probe, or None if the setting can't be read from the scene
+        """
+        if 'flag' in ctl:
+            return Probe('LWSceneInfo', 'renderOpts', None, None, ctl['flag'])
+        if 'probe' not in ctl:
+            return None
+
+        match = Plans.PROBE.match(ctl['probe'])
+        if match is None:
+            raise ValueError('Not a probe: %s' % ctl['probe'])
+        info, attr, args, index = match.groups()
+        if args is not None:
+            args = tuple(arg.strip() for arg in args.split(',') if arg.strip())
+        if index is not None:
+            index = int(index)
+        return Probe(str(info), str(attr), args, index, None)
+
+    # --------------------------------------------------------------------------
+    # Tab Logic
+    # --------------------------------------------------------------------------
+    @staticmethod
+    def gi_tab_logic(settings, cmd):
+        """ The controller logic for the Global Illum tab. """
+
+        # If radiosity is not interpolated, don't apply these
+        if settings['RadiosityInterpolation'] == False and cmd in \
+        ['RadiosityUseGradients', 'RadiosityUseBehindTest']:
+            return False
+
+        # Don't apply these on Backdrop Only
+        if settings['RadiosityType'] == 0 and cmd in \
+        ['IndirectBounces', 'RaysPerEvaluation2']:
+            return False
+
+        # Don't apply these on Backdrop Only/Monte Carlo, no interpolation
+        if settings['RadiosityInterpolation'] == False and \
+        settings['RadiosityType'] in [0, 1] and cmd in \
+        ['RaysPerEvaluation2', 'RadiosityTolerance', 'RadiosityMinPixelSpacing', 'RadiosityMaxPixelSpacing', 'RadiosityMultiplier']:
+            return False
+
+        return True
+
+    @staticmethod
+    def fx_tab_logic(settings, cmd):
+        """ The controller logic for the Effects tab. """
+        # Single color
+        if settings['GradientBackdrop'] == 1 and cmd == 'BackdropColor':
+            return False
+
+        # Gradient color
+        if settings['GradientBackdrop'] == 0 and cmd in \
+        ['ZenithColor', 'SkyColor', 'GroundColor', 'NadirColor', 'SkySqueezeColor', 'GroundSqueezeColor']:
+            return False
+
+        return True
+
+    @staticmethod
+    def cam_tab_logic(settings, cmd):
+        """ The controller logic for the Camera tab. """
+
+        # Threshold
+        if settings['AdaptiveSampling'] == False and cmd in \
+        ['MaxAntialiasing', 'AdaptiveThreshold']:
+            return False
+
+        return True
+
+
+# ------------------------------------------------------------------------------
+# Cost Estimates
+# ------------------------------------------------------------------------------
+class Costs:
+    """ Estimates the render cost of presets, relative to the defaults.
+
+    The cost of a preset is the pixels and camera samples it renders, times
+    a weighted sum of the work per sample: shading and light samples, ray
+    recursion, and radiosity rays scaled by the cost of the radiosity type.
+    Settings in sections that aren't enabled count with their default value,
+    as the preset leaves them to the scene.
+
+    Costs are cached per preset revision like the apply plans, so estimating
+    the whole library again after a change only costs the presets that
+    changed.
+    """
+    # Weights of the work per sample, in the order of the features
+    TERMS = ['base', 'shading', 'light', 'recursion', 'rays', 'bounce_rays']
+    # The model used until one has been calibrated. The radiosity types are
+    # Backdrop Only, Monte Carlo and Final Gather, and adaptive is the share
+    # of the samples between the minimum and maximum that adaptive sampling
+    # is expected to use.
+    DEFAULT_MODEL = {
+        'base': 1.0,
+        'shading': 0.1,
+        'light': 0.1,
+        'recursion': 0.05,
+        'rays': 0.01,
+        'bounce_rays': 0.01,
+        'types': [0.5, 1.0, 0.7],
+        'adaptive': 0.5
+    }
+    # How hard a calibration pulls the weights towards the current model,
+    # relative to what each measurement says about them
+    RIDGE = 0.01
+
+    # The model, and the cost of a preset with the default values
+    model = None
+    reference = None
+    # Relative costs by preset name, with the revision they were estimated at
+    cache = {}
+
+    @staticmethod
+    def estimate(name):
+        """ Get the estimated render cost of a preset.
+
+        @param   string  name  The name of the preset
+
+        @return  The cost relative to a preset with the default values
+        """
+        if Costs.model is None:
+            Costs.load()
+
+        key = (Presets.lineage(name), Presets.definitions)
+        cached = Costs.cache.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        cost = Costs.cost(Presets.user['presets'][name].resolve()) / \
+            Costs.reference
+        Costs.cache[name] = (key, cost)
+        return cost
+
+    @staticmethod
+    def estimate_all():
+        """ @return List of (name, relative cost) for all presets """
+        return [(name, Costs.estimate(name)) for name in Presets.names]
+
+    @staticmethod
+    def label(name):
+        """ @return The estimated cost of a preset, formatted for the list """
+        cost = Costs.estimate(name)
+        if cost < 10:
+            return '%.1fx' % cost
+        return '%dx' % round(cost)
+
+    @staticmethod
+    def cost(settings):
+        """ @return The cost of preset settings, in the units of the model """
+        features = Costs.features(settings)
+        return sum(Costs.model[term] * feature \
+            for term, feature in zip(Costs.TERMS, features))
+
+    @staticmethod
+    def features(settings):
+        """ Get what the cost of preset settings is made of.
+
+        @param   dict  settings  The settings of a preset
+
+        @return  List of the amount of each term of the model
+        """
+        value = lambda cmd: Costs.value(settings, cmd)
+        model = Costs.model
+
+        multiplier = 1
+        ctl = Presets.definitions.controls.get('ResolutionMultiplier')
+        if ctl is not None:
+            multiplier = ctl['values'][value('ResolutionMultiplier')]
+
+        samples = value('MinAntialiasing')
+        if value('AdaptiveSampling'):
+            samples += model['adaptive'] * \
+                max(0, value('MaxAntialiasing') - samples)
+
+        rays = bounce_rays = 0
+        if value('EnableRadiosity'):
+            kind = value('RadiosityType')
+            scale = model['types'][min(kind, len(model['types']) - 1)]
+            rays = scale * value('RaysPerEvaluation')
+            if kind != 0:
+                bounce_rays = scale * value('RaysPerEvaluation2') * \
+                    max(0, value('IndirectBounces') - 1)
+
+        area = float(multiplier * multiplier * max(1, samples))
+        return [area, area * value('ShadingSamples'), \
+            area * value('LightSamples'), area * value('RayRecursionLimit'), \
+            area * rays, area * bounce_rays]
+
+    @staticmethod
+    def value(settings, cmd):
+        """ @return A setting, or its default if its section isn't enabled """
+        definitions = Presets.definitions
+        section = definitions.section_of.get(cmd)
+        if section is not None and settings[section] == True:
+            return settings[cmd]
+        return definitions.defaults.get(cmd, 0)
+
+    @staticmethod
+    def calibrate(times):
+        """ Fit the weights of the model to measured render times.
+
+        The weights are fitted with least squares, pulled towards the current
+        weights scaled to the measurements, so terms that the measured
+        presets don't vary keep their proportion to the rest.
+
+        @param   list  times  (name, seconds) of presets rendered with the
+                              same scene
+
+        @return  List of (name, seconds, estimated seconds)
+        """
+        if Costs.model is None:
+            Costs.load()
+
+        rows = [Costs.features(Presets.user['presets'][name].resolve()) \
+            for name, seconds in times]
+        seconds = [t for name, t in times]
+        weights = [Costs.model[term] for term in Costs.TERMS]
+
+        predicted = [sum(w * x for w, x in zip(weights, row)) for row in rows]
+        scale = sum(p * t for p, t in zip(predicted, seconds)) / \
+            max(sum(p * p for p in predicted), 1e-12)
+        prior = [w * scale for w in weights]
+
+        n = len(Costs.TERMS)
+        a = [[sum(row[i] * row[j] for row in rows) for j in xrange(n)] \
+            for i in xrange(n)]
+        b = [sum(row[i] * t for row, t in zip(rows, seconds)) \
+            for i in xrange(n)]
+        for i in xrange(n):
+            ridge = Costs.RIDGE * (a[i][i] or 1.0)
+            a[i][i] += ridge
+            b[i] += ridge * prior[i]
+
+        weights = [max(0.0, w) for w in Costs.solve(a, b)]
+        for term, w in zip(Costs.TERMS, weights):
+            Costs.model[term] = w
+        Costs.changed()
+
+        return [(name, t, sum(w * x for w, x in zip(weights, row))) \
+            for (name, t), row in zip(times, rows)]
+
+    @staticmethod
+    def solve(a, b):
+        """ Solve a linear system with gaussian elimination.
+
+        @param   list  a  Rows of the coefficients, which are changed
+        @param   list  b  The right hand side, which is changed
+
+        @return  List of the unknowns
+        """
+        n = len(b)
+        for col in xrange(n):
+            pivot = max(xrange(col, n), key=lambda row: abs(a[row][col]))
+            a[col], a[pivot] = a[pivot], a[col]
+            b[col], b[pivot] = b[pivot], b[col]
+            for row in xrange(col + 1, n):
+                f = a[row][col] / a[col][col]
+                for k in xrange(col, n):
+                    a[row][k] -= f * a[col][k]
+                b[row] -= f * b[col]
+
+        x = [0.0] * n
+        for row in xrange(n - 1, -1, -1):
+            x[row] = (b[row] - sum(a[row][k] * x[k] \
+                for k in xrange(row + 1, n))) / a[row][row]
+        return x
+
+    @staticmethod
+    def load():
+        """ Load the cost model from the file next to the presets file, or
+        the default model if there's none.
+        """
+        model = dict(Costs.DEFAULT_MODEL)
+        try:
+            f = open(Costs.path(), 'r')
+            model.update(json.load(f))
+            f.close()
+        except (IOError, ValueError):
+            pass
+        Costs.model = model
+        Costs.changed()
+
+    @staticmethod
+    def save():
+        """ Save the cost model to the file next to the presets file. """
+        f = open(Costs.path() + '.tmp', 'w')
+        json.dump(Costs.model, f, indent=4, sort_keys=True, \
+            separators=(',', ': '))
+        f.close()
+        Presets.replace_file(Costs.path() + '.tmp', Costs.path())
+
+    @staticmethod
+    def changed():
+        """ Forget the estimates, after the model has changed. """
+        Costs.cache = {}
+        Costs.reference = Costs.cost(Record(Presets.definitions)) or 1.0
+
+    @staticmethod
+    def path():
+        """ @return Absolute path to the cost model """
+        folder = os.path.dirname(Presets.file_path())
+        return os.path.join(folder, COST_MODEL)
+
+
+# ------------------------------------------------------------------------------
+# Preset Columns
+# ------------------------------------------------------------------------------
+class Columns:
+    """ A columnar view of the presets, for queries across the library.
+
+    Every setting in the definitions gets a column with its value in each
+    preset, typed like the slots of a Record: flags as bytes, ints and packed
+    colors as ints, floats as doubles, and the comments as a list. Derived
+    presets hold their resolved values. Each row remembers the lineage it was
+    read at, so after a change only the rows of the presets that changed are
+    read again.
+
+    Filters compare a whole column at once, and the rows matching all the
+    conditions are returned in the order of the list, e.g. the presets with
+    Final Gather, more than 500 rays and no interpolation:
+
+        Columns.filter([('EnableRadiosity', '==', 1),
+            ('RadiosityType', '==', 2), ('RaysPerEvaluation', '>', 500),
+            ('RadiosityInterpolation', '==', 0)])
+    """
+    # Comparisons a condition can make, by operator
+    OPERATORS = {
+        '==': operator.eq,
+        '!=': operator.ne,
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge
+    }
+    # Aggregates of a column, by name. Those of no values are None.
+    AGGREGATES = {
+        'count': len,
+        'sum': sum,
+        'min': lambda values: min(values) if values else None,
+        'max': lambda values: max(values) if values else None,
+        'mean': lambda values: \
+            sum(values) / float(len(values)) if values else None
+    }
+    # Array type code of the columns of each kind of slot. The comments are
+    # kept in a list.
+    TYPECODES = {
+        Record.FLAG: 'B',
+        Record.INT: 'i',
+        Record.RGB: 'i',
+        Record.FLOAT: 'd'
+    }
+
+    # Column by setting key, and the columns of the flags, ints and floats
+    # of a Record in the order of their slots
+    columns = {}
+    slotted = []
+    # Name of the preset on each row, the row of each name, and the lineage
+    # each row was read at
+    names = []
+    rows = {}
+    lineages = []
+    # The definitions and preset bodies the columns were read from
+    source = None
+
+    @staticmethod
+    def refresh():
+        """ Bring the columns up to date with the presets. """
+        definitions = Presets.definitions
+        presets = Presets.user['presets']
+        if Columns.source != (definitions, presets):
+            Columns.reset(definitions)
+            Columns.source = (definitions, presets)
+
+        # Rows of removed presets are filled with the last row
+        for name in [s for s in Columns.names if s not in Presets.names]:
+            Columns.drop(name)
+
+        for name in Presets.names:
+            lineage = Presets.lineage(name)
+            row = Columns.rows.get(name)
+            if row is not None and Columns.lineages[row] == lineage:
+                continue
+            Columns.store(name, presets[name].resolve(), lineage)
+
+    @staticmethod
+    def reset(definitions):
+        """ Start over with empty columns for the settings in definitions. """
+        Columns.columns = {}
+        Columns.slotted = [[], [], []]
+        kinds = [Record.FLAG, Record.INT, Record.FLOAT]
+        for key, (kind, i) in definitions.slots.iteritems():
+            if kind == Record.COMMENT:
+                Columns.columns[key] = []
+                continue
+            column = array.array(Columns.TYPECODES[kind])
+            Columns.columns[key] = column
+            if kind == Record.RGB:
+                kind = Record.INT
+            Columns.slotted[kinds.index(kind)].append(column)
+        Columns.names = []
+        Columns.rows = {}
+        Columns.lineages = []
+
+    @staticmethod
+    def store(name, record, lineage):
+        """ Read the values of a preset into its row.
+
+        @param  string  name     The name of the preset
+        @param  Record  record   The resolved settings of the preset
+        @param  tuple   lineage  The lineage of the preset
+        """
+        values = (record.flags, record.ints, record.floats)
+        row = Columns.rows.get(name)
+        if row is None:
+            Columns.rows[name] = len(Columns.names)
+            Columns.names.append(name)
+            Columns.lineages.append(lineage)
+            for columns, slots in zip(Columns.slotted, values):
+                map(array.array.append, columns, slots)
+            Columns.columns['comment'].append(record.comment)
+        else:
+            Columns.lineages[row] = lineage
+            for columns, slots in zip(Columns.slotted, values):
+                map(operator.setitem, columns, \
+                    itertools.repeat(row, len(columns)), slots)
+            Columns.columns['comment'][row] = record.comment
+
+    @staticmethod
+    def drop(name):
+        """ Remove the row of a preset, moving the last row into its place.
+
+        @param  string  name  The name of the preset
+        """
+        row = Columns.rows.pop(name)
+        last = len(Columns.names) - 1
+        if row != last:
+            moved = Columns.names[last]
+            Columns.names[row] = moved
+            Columns.rows[moved] = row
+            Columns.lineages[row] = Columns.lineages[last]
+            for column in Columns.columns.itervalues():
+                column[row] = column[last]
+        Columns.names.pop()
+        Columns.lineages.pop()
+        for column in Columns.columns.itervalues():
+            column.pop()
+
+    @staticmethod
+    def filter(conditions):
+        """ Find the presets matching all conditions.
+
+        @param   list  conditions  (key, operator, value) tuples, where the
+                                   operator is one of OPERATORS
+
+        @return  List of preset names, in the order of the list
+        """
+        Columns.refresh()
+        size = len(Columns.names)
+        matches = None
+        for key, op, value in conditions:
+            compare = Columns.OPERATORS[op]
+            found = map(compare, Columns.column(key), \
+                itertools.repeat(Columns.coerce(key, value), size))
+            if matches is not None:
+                found = map(operator.and_, matches, found)
+            matches = found
+
+        if matches is None:
+            names = Columns.names
+        else:
+            names = itertools.compress(Columns.names, matches)
+        return sorted(names, key=Presets.names.index)
+
+    @staticmethod
+    def aggregate(key, function, names=None):
+        """ Aggregate the values of a setting.
+
+        @param   string  key       The command or section id
+        @param   string  function  One of AGGREGATES
+        @param   list    names     The presets to aggregate, all if None
+
+        @return  The aggregate, of the packed values for colors
+        """
+        aggregate = Columns.AGGREGATES[function]
+        Columns.refresh()
+        column = Columns.column(key)
+        if names is None:
+            return aggregate(column)
+        rows = Columns.rows
+        return aggregate([column[rows[name]] for name in names])
+
+    @staticmethod
+    def update(names, values):
+        """ Set values in many presets, and save them once.
+
+        @param   list  names   The presets to update
+        @param   dict  values  The new values, by command or section id
+
+        @return  Number of presets that changed. Nothing is changed if any of
+                 the values can't be set, see Columns.check().
+        """
+        for key, value in values.iteritems():
+            Columns.check(key, value)
+
+        changed = 0
+        for name in names:
+            found = False
+            for key, value in values.iteritems():
+                found = Presets.set(name, key, value) or found
+            changed += found
+
+        # Their rows are read again by the next query
+        if changed:
+            Presets.save()
+        return changed
+
+    @staticmethod
+    def column(key):
+        """ @return The column of a setting, or raise KeyError """
+        if key not in Presets.definitions.slots:
+            raise KeyError('no setting named %r' % key)
+        return Columns.columns[key]
+
+    @staticmethod
+    def check(key, value):
+        """ Check that a setting can hold a value, or raise KeyError for an
+        unknown setting and ValueError for a value of the wrong type. Bools
+        and section switches are 0 or 1, popups the index of an item, and
+        colors three channels from 0 to 255.
+
+        @param   string  key    Command or section id
+        @param   mixed   value  The value to set
+        """
+        if key not in Presets.definitions.slots:
+            raise KeyError('no setting named %r' % key)
+        kind = Presets.definitions.slots[key][0]
+        ctl = Presets.definitions.controls.get(key)
+        valid = True
+        if kind == Record.RGB:
+            valid = isinstance(value, list) and len(value) == 3 and \
+                all(type(c) is int and 0 <= c <= 255 for c in value)
+        elif kind == Record.FLAG:
+            count = len(ctl['items']) if ctl and ctl['type'] == 'wpopup' else 2
+            valid = type(value) in (int, bool) and 0 <= value < count
+        elif kind == Record.INT:
+            valid = type(value) in (int, bool) and \
+                -2 ** 31 <= value < 2 ** 31
+        elif kind == Record.FLOAT:
+            valid = type(value) in (int, float, bool)
+        if not valid:
+            raise ValueError('not a value for %s: %s' % (key, \
+                json.dumps(value)))
+
+    @staticmethod
+    def coerce(key, value):
+        """ @return A value compared the way its column holds it """
+        if Presets.definitions.slots[key][0] == Record.RGB:
+            return Record.pack(value)
+        return value
+
+
+# ------------------------------------------------------------------------------
+# Scenes Class
+# ------------------------------------------------------------------------------
+class Scenes:
+    """ Reads and rewrites the render settings in LightWave scene files.
+
+    A setting is stored on the scene line named by the control's scene key,
+    or by its command if it hasn't got one. Toggles with a scene bit are
+    stored as bits in a flags line.
+    """
+    # Extension of LightWave scene files
+    EXTENSION = '.lws'
+
+    @staticmethod
+    def edits(plan):
+        """ Translate an apply plan into edits of scene lines.
+
+        Operations that depends on the scene in LightWave are treated as
+        setting the state they check for.
+
+        @param   tuple  plan  Operations, as returned by Plans.plan()
+
+        @return  Dict by scene line key, of either the new value as a string,
+                 or a dict of bit states by bit.
+        """
+        edits = {}
+        controls = Presets.definitions.controls
+        for op in plan:
+            ctl = controls[op.command]
+            key = str(ctl.get('scene', op.command))
+
+            if op.arg is None:
+                value = '1' if op.state else '0'
+            else:
+                value = op.arg
+
+            if 'scene_bit' in ctl:
+                edits.setdefault(key, {})[ctl['scene_bit']] = value == '1'
+            elif ctl.get('scene_invert'):
+                edits[key] = '0' if value == '1' else '1'
+            else:
+                edits[key] = value
+        return edits
+
+    @staticmethod
+    def section_edits(plan):
+        """ Translate an apply plan into edits of scene lines per section.
+
+        @param   tuple  plan  Operations, as returned by Plans.plan()
+
+        @return  OrderedDict of edits, as returned by edits(), by section id
+        """
+        section_of = Presets.definitions.section_of
+        sections = collections.OrderedDict()
+        for op in plan:
+            sections.setdefault(section_of[op.command], []).append(op)
+
+        for section_id, ops in sections.iteritems():
+            sections[section_id] = Scenes.edits(ops)
+        return sections
+
+    @staticmethod
+    def keys():
+        """ @return Set of the scene line keys used by the definitions """
+        keys = set()
+        for cmd, ctl in Presets.definitions.controls.iteritems():
+            keys.add(str(ctl.get('scene', cmd)))
+        return keys
+
+    @staticmethod
+    def read(path, keys):
+        """ Read render settings from a scene.
+
+        The first line of each key is read, so for camera settings it's the
+        settings of the first camera.
+
+        @param   string  path  Path to the scene
+        @param   set     keys  The scene line keys to read
+
+        @return  Dict of the values by key, None if path isn't a scene
+        """
+        f = open(path, 'rb')
+        if not f.readline().startswith('LWSC'):
+            f.close()
+            return None
+
+        values = {}
+        for line in f:
+            parts = line.split(None, 1)
+            if len(parts) == 2 and parts[0] in keys and \
+            parts[0] not in values:
+                values[parts[0]] = parts[1].strip()
+                if len(values) == len(keys):
+                    break
+        f.close()
+        return values
+
+    @staticmethod
+    def match(values, edits):
+        """ Check how well scene settings matches some edits.
+
+        Settings the scene has no line for can't be compared, and rewrite()
+        can't add them, so they don't count.
+
+        @param   dict  values  Settings as returned by read()
+        @param   dict  edits   Edits as returned by edits()
+
+        @return  'exact' if all settings match, 'partial' if some of them
+                 match, else None.
+        """
+        matched = 0
+        total = 0
+        for key, edit in edits.iteritems():
+            if key not in values:
+                continue
+            total += len(edit) if isinstance(edit, dict) else 1
+            if isinstance(edit, dict):
+                try:
+                    flags = int(values[key])
+                except ValueError:
+                    continue
+                for bit, state in edit.iteritems():
+                    if bool(flags & bit) == state:
+                        matched += 1
+            elif Scenes.same(values[key], edit):
+                matched += 1
+
+        if total and matched == total:
+            return 'exact'
+        if matched:
+            return 'partial'
+        return None
+
+    @staticmethod
+    def rewrite(src, dest, edits):
+        """ Write a scene with edited render settings.
+
+        Only existing lines are edited, and the scene is written to a
+        temporary file that is moved in place when complete. A scene rewritten
+        in place is left untouched if no line changed.
+
+        @param   string  src    Path to the scene to read
+        @param   string  dest   Path to write the scene to
+        @param   dict    edits  Edits, as returned by edits()
+
+        @return  True if any line was changed, None if src isn't a scene
+        """
+        f = open(src, 'rb')
+        if not f.readline().startswith('LWSC'):
+            f.close()
+            return None
+        f.seek(0)
+
+        tmp = dest + '.tmp'
+        out = open(tmp, 'wb')
+        changed = False
+        for line in f:
+            parts = line.split(None, 1)
+            if parts and parts[0] in edits:
+                new_line = Scenes.edit_line(line, parts, edits[parts[0]])
+                if new_line != line:
+                    changed = True
+                    line = new_line
+            out.write(line)
+        out.close()
+        f.close()
+
+        if not changed and os.path.abspath(src) == os.path.abspath(dest):
+            os.remove(tmp)
+        else:
+            Presets.replace_file(tmp, dest)
+        return changed
+
+    @staticmethod
+    def edit_line(line, parts, edit):
+        """ Apply an edit to a scene line.
+
+        @param   string  line   The line
+        @param   list    parts  The key and the rest of the line
+        @param   mixed   edit   The edit for the key
+
+        @return  The edited line
+        """
+        indent = line[:len(line) - len(line.lstrip())]
+        eol = line[len(line.rstrip('\r\n')):]
+
+        if isinstance(edit, dict):
+            try:
+                flags = int(parts[1])
+            except (IndexError, ValueError):
+                return line
+            for bit, state in edit.iteritems():
+                if state:
+                    flags |= bit
+                else:
+                    flags &= ~bit
+            value = str(flags)
+        else:
+            value = edit
+
+        # Keep the line as it is if it already has the value
+        if len(parts) > 1 and Scenes.same(parts[1], value):
+            return line
+        return indent + parts[0] + ' ' + value + eol
+
+    @staticmethod
+    def same(a, b):
+        """ Compare two scene values, numerically where they are numbers.
+
+        @param   string  a  The first value
+        @param   string  b  The second value
+
+        @return  True if the values are considered equal
+        """
+        a = a.split()
+        b = b.split()
+        if len(a) != len(b):
+            return False
+        for x, y in zip(a, b):
+            if x == y:
+                continue
+            try:
+                if not Presets.same(float(x), float(y)):
+                    return False
+            except ValueError:
+                return False
+        return True
+
+
+# ------------------------------------------------------------------------------
+# Definitions Class
+# ------------------------------------------------------------------------------
+class Definitions:
+    """ The compiled definitions of tabs, sections and controls.
+
+    The tree from the definitions file is kept in tabs, which also holds the
+    references to the controls in the panel. Flat indexes into the tree are
+    built when the file is compiled, and the result is cached on disk so the
+    JSON only has to be parsed when the definitions file changes.
+    """
+    # Control types, indexed by their type code
+    TYPES = ['bool', 'int', 'float', 'percent', 'angle', 'wpopup', 'minirgb']
+
+    # Version of the compiled definitions, bumped when the cached layout changes
+    VERSION = 2
+
+    # Compiled definitions kept for the session, and the file stamp they
+    # were loaded with.
+    loaded = None
+    stamp = None
+
+    def __init__(self, tabs):
+        """ Compile the definitions tree.
+
+        @param  OrderedDict  tabs  The tabs from the definitions file
+        """
+        self.tabs = tabs
+        # Tab names, in the order of the tabs
+        self.tab_names = []
+        # Sections and controls by section id and command
+        self.sections = collections.OrderedDict()
+        self.controls = collections.OrderedDict()
+        # Section id of each control, by command
+        self.section_of = {}
+        # Type code of each control, by command
+        self.types = {}
+        # Default value for every setting in a preset
+        self.defaults = collections.OrderedDict()
+        # Slot of every setting in a Record by key, as a (kind, index) tuple,
+        # and the default values of the slots of each kind.
+        self.slots = collections.OrderedDict()
+        self.slot_defaults = {
+            Record.FLAG: array.array('B'),
+            Record.INT: array.array('i'),
+            Record.FLOAT: array.array('d')
+        }
+
+        for tab in tabs:
+            self.tab_names.append(tab.encode('utf-8'))
+            for section in tabs[tab].itervalues():
+                section_id = section['id']
+                self.sections[section_id] = section
+                self.defaults[section_id] = 0
+                self.add_slot(section_id, Record.FLAG, 0)
+                for ctl in section['controls']:
+                    cmd = ctl['command']
+                    self.controls[cmd] = ctl
+                    self.section_of[cmd] = section_id
+                    self.types[cmd] = Definitions.TYPES.index(ctl['type'])
+                    self.defaults[cmd] = ctl['default']
+                    self.add_slot(cmd, Record.KINDS[ctl['type']], \
+                        ctl['default'])
+        self.defaults['comment'] = ''
+        self.slots['comment'] = (Record.COMMENT, 0)
+
+    def add_slot(self, key, kind, default):
+        """ Add the slot for a setting in a Record.
+
+        @param  string  key      The command or section id
+        @param  int     kind     The kind of slot
+        @param  mixed   default  The default value
+        """
+        if kind == Record.RGB:
+            defaults = self.slot_defaults[Record.INT]
+            default = Record.pack(default)
+        else:
+            defaults = self.slot_defaults[kind]
+        self.slots[key] = (kind, len(defaults))
+        defaults.append(default)
+
+    @staticmethod
+    def load(path=None):
+        """ Load the compiled definitions.
+
+        The definitions are compiled once per session, and on disk the
+        compiled result is reused as long as the definitions file has the
+        same modification time and size, or the same content hash.
+
+        @param   string  path  Path to the definitions file, defaults to the
+                               file next to this script.
+
+        @return  Definitions, or None if the file failed to load
+        """
+        if path is None:
+            dir_path = os.path.dirname(os.path.realpath(__file__))
+            path = os.path.join(dir_path, DEFINITIONS_FILE)
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (path, st.st_mtime, st.st_size)
+        if Definitions.loaded and Definitions.stamp == stamp:
+            return Definitions.loaded
+
+        cache_file = os.path.join(os.path.dirname(path), DEFINITIONS_CACHE)
+        try:
+            f = open(cache_file, 'rb')
+            cache = cPickle.load(f)
+            f.close()
+        except:
+            cache = None
+
+        if cache and cache.get('version') != Definitions.VERSION:
+            cache = None
+
+        if cache and (cache['mtime'], cache['size']) == stamp[1:]:
+            definitions = cache['definitions']
+        else:
+            try:
+                f = open(path, 'rb')
+                data = f.read()
+                f.close()
+            except IOError:
+                return None
+            # Only needed when the definitions have changed, so not imported
+            # with the module
+            import hashlib
+            digest = hashlib.md5(data).hexdigest()
+
+            if cache and cache['md5'] == digest:
+                definitions = cache['definitions']
+            else:
+                try:
+                    tabs = json.loads(data, \
+                        object_pairs_hook=collections.OrderedDict)['tabs']
+                    definitions = Definitions(tabs)
+                except (ValueError, KeyError):
+                    return None
+
+            # Cache the compiled definitions. The plugin folder might be read
+            # only, in which case we simply do without the cache.
+            cache = {
+                'version': Definitions.VERSION,
+                'mtime': st.st_mtime,
+                'size': st.st_size,
+                'md5': digest,
+                'definitions': definitions
+            }
+            try:
+                f = open(cache_file, 'wb')
+                cPickle.dump(cache, f, cPickle.HIGHEST_PROTOCOL)
+                f.close()
+            except IOError:
+                pass
+
+        # Bind the codecs for each control type. Done after the definitions
+        # are cached, as they're part of the code and not the definitions.
+        for ctl in definitions.controls.itervalues():
+            ctl['codec'] = CODECS[ctl['type']]
+
+        Definitions.loaded = definitions
+        Definitions.stamp = stamp
+        return definitions
+
+
+# ------------------------------------------------------------------------------
+# Control Type Codecs
+# ------------------------------------------------------------------------------
+class Codec:
+    """ Converts a setting of a control type between the value stored in the
+    preset, the controller in the panel and the argument for its command.
+    """
+    def create(self, panel, ctl):
+        """ Create the controller for a control.
+
+        @param   LWPanel  panel  The panel to create the controller in
+        @param   dict     ctl    The control from the definitions
+
+        @return  The controller
+        """
+        controller = getattr(panel, ctl['type'] + '_ctl')(ctl['label'])
+        controller.set_w(ctl.get('width', 150))
+        return controller
+
+    def set(self, controller, value):
+        """ Set the controller to a stored value. """
+        controller.set_int(value)
+
+    def get(self, controller):
+        """ @return The value of the controller, as stored in the preset """
+        return controller.get_int()
+
+    def arg(self, ctl, value):
+        """ @return The stored value as an argument to the command """
+        return str(value)
+
+    def scene(self, ctl, value):
+        """ @return The stored value as the scene info reports it """
+        return value
+
+
+class FloatCodec(Codec):
+    """ float controls. """
+    def set(self, controller, value):
+        controller.set_float(value)
+
+    def get(self, controller):
+        return controller.get_float()
+
+
+class PercentCodec(FloatCodec):
+    """ percent controls, where commands takes a fraction. """
+    def arg(self, ctl, value):
+        return str(value / 100)
+
+    def scene(self, ctl, value):
+        return value / 100.0
+
+
+class AngleCodec(FloatCodec):
+    """ angle controls, stored in degrees but edited in radians. """
+    def set(self, controller, value):
+        controller.set_float(math.radians(value))
+
+    def get(self, controller):
+        return math.degrees(controller.get_float())
+
+    def scene(self, ctl, value):
+        return math.radians(value)
+
+
+class PopupCodec(Codec):
+    """ wpopup controls, with optional values for the commands in place of
+    the item index.
+    """
+    def create(self, panel, ctl):
+        # Get rid of Unicode character (u')
+        items = [s.encode('utf-8') for s in ctl['items']]
+        return panel.wpopup_ctl(ctl['label'], items, 150)
+
+    def arg(self, ctl, value):
+        return str(self.scene(ctl, value))
+
+    def scene(self, ctl, value):
+        if 'values' in ctl:
+            value = ctl['values'][value]
+        return value
+
+
+class RGBCodec(Codec):
+    """ minirgb controls, stored as 0-255 and set with 0-1 commands. """
+    def create(self, panel, ctl):
+        return panel.minirgb_ctl(ctl['label'])
+
+    def set(self, controller, value):
+        controller.set_ivec(value[0], value[1], value[2])
+
+    def get(self, controller):
+        return list(controller.get_ivec())
+
+    def arg(self, ctl, value):
+        return '%(r)s %(g)s %(b)s' % \
+            {'r': value[0] / 255.0, \
+             'g': value[1] / 255.0, \
+             'b': value[2] / 255.0}
+
+    def scene(self, ctl, value):
+        return tuple(c / 255.0 for c in value)
+
+
+# Codecs by control type
+CODECS = {
+    'bool':    Codec(),
+    'int':     Codec(),
+    'float':   FloatCodec(),
+    'percent': PercentCodec(),
+    'angle':   AngleCodec(),
+    'wpopup':  PopupCodec(),
+    'minirgb': RGBCodec()
+}
+
+# Don't leave changes behind when Python exits
+atexit.register(Presets.exit)
@@ -0,0 +1,108 @@
+""" Render Presets Cost
+
+Lists the estimated render cost of each preset from the command line, relative
+to a preset with the default values, and calibrates the cost model against
+measured render times.
+
+Usage:
+    python js_render_presets_cost.py -c js_render_presets.cfg [-t TIMES]
+
+The times are a csv file with the name of a preset and the seconds it took to
+render, for presets rendered with the same scene. The calibrated model is saved
+next to the presets file, where the plugin reads it from.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import csv
+import argparse
+
+from js_render_presets_core import Presets, Definitions, Costs
+
+
+# ------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------
+def read_times(path):
+    """ Read measured render times.
+
+    @param   string  path  Path to a csv file of preset names and seconds
+
+    @return  List of (name, seconds)
+    """
+    times = []
+    f = open(path, 'rb')
+    for row in csv.reader(f):
+        if len(row) < 2 or not row[0].strip():
+            continue
+        try:
+            times.append((row[0].strip(), float(row[1])))
+        except ValueError:
+            # A header line
+            continue
+    f.close()
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Estimate the render cost of presets.')
+    parser.add_argument('-c', '--presets', required=True,
+        help='path to js_render_presets.cfg')
+    parser.add_argument('-d', '--definitions',
+        help='path to js_render_presets.def (default: next to this script)')
+    parser.add_argument('-t', '--times',
+        help='csv file of preset names and measured render seconds, to '
+            'calibrate the cost model with')
+    args = parser.parse_args(argv)
+
+    Presets.definitions = Definitions.load(args.definitions)
+    if Presets.definitions is None:
+        parser.error('could not load the definitions file')
+
+    Presets.path = os.path.abspath(args.presets)
+    Presets.load()
+
+    if args.times:
+        try:
+            times = read_times(args.times)
+        except IOError, e:
+            parser.error('could not read the times: %s' % e)
+        for name, seconds in times:
+            if name not in Presets.names:
+                parser.error('no preset named "%s"' % name)
+        if not times:
+            parser.error('no times found in %s' % args.times)
+
+        print '%-40s %10s %10s' % ('preset', 'seconds', 'estimated')
+        for name, seconds, estimated in Costs.calibrate(times):
+            print '%-40s %10.2f %10.2f' % (name, seconds, estimated)
+        try:
+            Costs.save()
+        except (IOError, OSError), e:
+            print >>sys.stderr, 'Failed to save the cost model: %s' % e
+            return 1
+        print 'Cost model saved to %s' % Costs.path()
+        print
+
+    print '%-40s %10s' % ('preset', 'cost')
+    for name, cost in Costs.estimate_all():
+        print '%-40s %10.2f' % (name, cost)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
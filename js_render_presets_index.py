@@ -0,0 +1,310 @@
+""" Render Presets Index
+
+Scans directories of LightWave scene files from the command line, and reports
+which presets each scene matches, exactly or partially per section. The
+settings read from each scene are kept in an index file, so only scenes that
+are new or have changed since the last scan are read again.
+
+Usage:
+    python js_render_presets_index.py -c js_render_presets.cfg PATH...
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import collections
+import multiprocessing
+
+from js_render_presets_core import Presets, Plans, Definitions, Scenes
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+INDEX_FILE = 'js_render_presets.idx'
+# Version of the index format
+INDEX_VERSION = 1
+
+
+# ------------------------------------------------------------------------------
+# Worker Process
+# ------------------------------------------------------------------------------
+# The scene line keys to read, set in each worker process when the pool starts
+_keys = None
+
+
+def init_worker(keys):
+    """ Initialize a worker process with the keys to read. """
+    global _keys
+    _keys = keys
+
+
+def read_scene(path):
+    """ Read the settings of one scene in a worker process.
+
+    @param   string  path  Path to the scene
+
+    @return  Tuple of the path, the values from Scenes.read() and an error
+             message or None.
+    """
+    try:
+        return path, Scenes.read(path, _keys), None
+    except (IOError, OSError), e:
+        return path, None, str(e)
+
+
+# ------------------------------------------------------------------------------
+# Index Class
+# ------------------------------------------------------------------------------
+class Index:
+    """ The persistent index of scene settings and matching presets. """
+
+    def __init__(self, path, keys):
+        """ Load the index, or start a new if it's missing or outdated.
+
+        @param  string  path  Path to the index file
+        @param  set     keys  The scene line keys the index should hold
+        """
+        self.path = path
+        self.keys = sorted(keys)
+        self.changed = False
+
+        try:
+            f = open(path, 'r')
+            data = json.load(f, object_pairs_hook=collections.OrderedDict)
+            f.close()
+        except (IOError, ValueError):
+            data = None
+
+        if not data or data.get('version') != INDEX_VERSION or \
+        data.get('keys') != self.keys:
+            data = {'presets': None, 'scenes': {}}
+            self.changed = True
+
+        # Hash of the preset settings the matches were made against
+        self.presets = data['presets']
+        # Entries by scene path, with mtime, size, values and matches. Files
+        # that turned out not to be scenes are kept with values set to None,
+        # so they aren't read again.
+        self.scenes = data['scenes']
+
+    def save(self):
+        """ Write the index, if anything changed. """
+        if not self.changed:
+            return
+
+        data = {
+            'version': INDEX_VERSION,
+            'keys': self.keys,
+            'presets': self.presets,
+            'scenes': self.scenes
+        }
+        f = open(self.path + '.tmp', 'w')
+        json.dump(data, f, separators=(',', ':'))
+        f.close()
+        Presets.replace_file(self.path + '.tmp', self.path)
+        self.changed = False
+
+    def update(self, paths, jobs):
+        """ Bring the index up to date with the scenes in paths.
+
+        @param   list  paths  Scene files and directories to search
+        @param   int   jobs   Number of worker processes
+
+        @return  Tuple of the set of scenes found in paths, the number of
+                 scenes read, and the number that failed to read
+        """
+        seen = set()
+        stale = []
+        for path in find_scenes(paths):
+            st = os.stat(path)
+            seen.add(path)
+            entry = self.scenes.get(path)
+            if entry and entry['mtime'] == st.st_mtime and \
+            entry['size'] == st.st_size:
+                continue
+            self.scenes[path] = {
+                'mtime': st.st_mtime,
+                'size': st.st_size,
+                'values': None,
+                'matches': None
+            }
+            stale.append(path)
+
+        # Forget scenes that no longer exist. Scenes outside of paths are
+        # kept, for the next scan of the directories they're in.
+        for path in self.scenes.keys():
+            if path not in seen and not os.path.isfile(path):
+                del self.scenes[path]
+                self.changed = True
+
+        failed = 0
+        if stale:
+            self.changed = True
+            pool = multiprocessing.Pool(jobs, init_worker, (set(self.keys),))
+            for path, values, error in \
+            pool.imap_unordered(read_scene, stale, 16):
+                if error:
+                    print >>sys.stderr, '%s: %s' % (path, error)
+                    failed += 1
+                    del self.scenes[path]
+                else:
+                    self.scenes[path]['values'] = values
+            pool.close()
+            pool.join()
+
+        return seen, len(stale) - failed, failed
+
+    def match(self, expected):
+        """ Match the scenes against the presets.
+
+        Scenes are only matched again if they've been read again, or if the
+        presets have changed since the last match.
+
+        @param  OrderedDict  expected  Scene edits by section, by preset name
+        """
+        digest = hashlib.md5(json.dumps(expected)).hexdigest()
+        rematch = digest != self.presets
+        self.presets = digest
+
+        for entry in self.scenes.itervalues():
+            if entry['matches'] is not None and not rematch:
+                continue
+
+            matches = collections.OrderedDict()
+            if entry['values'] is None:
+                entry['matches'] = matches
+                continue
+
+            for name, sections in expected.iteritems():
+                statuses = collections.OrderedDict()
+                for section_id, edits in sections.iteritems():
+                    statuses[section_id] = Scenes.match(entry['values'], edits)
+
+                found = [s for s in statuses.itervalues() if s]
+                if not found:
+                    continue
+                if len(found) == len(statuses) and 'partial' not in found:
+                    status = 'exact'
+                else:
+                    status = 'partial'
+                matches[name] = [status, statuses]
+
+            entry['matches'] = matches
+            self.changed = True
+
+
+# ------------------------------------------------------------------------------
+# Helpers
+# ------------------------------------------------------------------------------
+def find_scenes(paths):
+    """ Find the scene files in paths.
+
+    @param   list  paths  Scene files and directories to search
+
+    @return  Generator of absolute paths
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.abspath(path)
+            continue
+
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                if name.lower().endswith(Scenes.EXTENSION):
+                    yield os.path.abspath(os.path.join(root, name))
+
+
+def expected_settings():
+    """ Get the scene settings of the presets.
+
+    Only the settings a preset sets are compared, and not the ones it leaves
+    at their defaults.
+
+    @return  OrderedDict of scene edits by section, by preset name
+    """
+    expected = collections.OrderedDict()
+    for name in Presets.names:
+        settings = Presets.user['presets'][name].resolve().sparse()
+        plan = [op for op in Plans.plan(name) if op.command in settings]
+        sections = Scenes.section_edits(plan)
+        if sections:
+            expected[name] = sections
+    return expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Index which presets LightWave scene files match.')
+    parser.add_argument('paths', nargs='+', metavar='path',
+        help='scene file or directory of scene files')
+    parser.add_argument('-c', '--presets', required=True,
+        help='path to js_render_presets.cfg')
+    parser.add_argument('-d', '--definitions',
+        help='path to js_render_presets.def (default: next to this script)')
+    parser.add_argument('-i', '--index', default=INDEX_FILE,
+        help='path to the index file (default: %s)' % INDEX_FILE)
+    parser.add_argument('-u', '--unmatched', action='store_true',
+        help='only list scenes that match no preset exactly')
+    parser.add_argument('-j', '--jobs', type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    Presets.definitions = Definitions.load(args.definitions)
+    if Presets.definitions is None:
+        parser.error('could not load the definitions file')
+
+    Presets.path = os.path.abspath(args.presets)
+    Presets.load()
+
+    start = time.time()
+    index = Index(args.index, Scenes.keys())
+    seen, read, failed = index.update(args.paths, args.jobs)
+    index.match(expected_settings())
+    index.save()
+    elapsed = time.time() - start
+
+    scenes = 0
+    for path in sorted(seen):
+        if path not in index.scenes or index.scenes[path]['values'] is None:
+            continue
+        scenes += 1
+        matches = index.scenes[path]['matches']
+        exact = [n for n, m in matches.iteritems() if m[0] == 'exact']
+        if args.unmatched and exact:
+            continue
+
+        found = []
+        for name, (status, sections) in matches.iteritems():
+            if status == 'exact':
+                found.append('%s (exact)' % name)
+            else:
+                parts = ['%s %s' % (s, st) for s, st in sections.iteritems() \
+                    if st]
+                found.append('%s (%s)' % (name, ', '.join(parts)))
+        print '%s: %s' % (path, '; '.join(found) or '-')
+
+    print >>sys.stderr, '%d scenes, %d read, %d failed in %.2f s' % \
+        (scenes, read, failed, elapsed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+""" Render Presets Query
+
+Finds presets by their settings from the command line, aggregates settings
+across the presets found, and sets values in all of them at once.
+
+Usage:
+    python js_render_presets_query.py -c js_render_presets.cfg \
+        [-w CONDITION ...] [-a FUNCTION:KEY ...] [-s KEY=VALUE ...]
+
+Conditions compare a setting with a value, like RaysPerEvaluation>500, and a
+preset has to match all of them. Values are read as json, so colors are given
+as [r,g,b], and anything that isn't json is read as a string. The presets set
+are saved once, when all of them have been updated.
+"""
+
+__author__     = 'Johan Steen'
+__copyright__  = 'Copyright (C) 2010-2012, Johan Steen'
+__credits__    = ''
+__license__    = 'New BSD License'
+__version__    = '2.0.1'
+__maintainer__ = 'Johan Steen'
+__email__      = 'http://www.artstorm.net/contact/'
+__status__     = 'Production'
+__lwver__      = '11'
+
+# ------------------------------------------------------------------------------
+# Import Modules
+# ------------------------------------------------------------------------------
+import os
+import re
+import sys
+import json
+import argparse
+
+from js_render_presets_core import Presets, Definitions, Writer, Columns
+
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+# A condition, as key, operator and value. The two character operators are
+# tried first, so <= isn't read as < followed by =.
+CONDITION = re.compile(r'^\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(.*?)\s*$')
+
+
+# ------------------------------------------------------------------------------
+# Main
+# ------------------------------------------------------------------------------
+def read_value(text):
+    """ @return A value from the command line, as json or else a string """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Query and update presets by their settings.')
+    parser.add_argument('-c', '--presets', required=True,
+        help='path to js_render_presets.cfg')
+    parser.add_argument('-d', '--definitions',
+        help='path to js_render_presets.def (default: next to this script)')
+    parser.add_argument('-w', '--where', action='append', default=[],
+        metavar='CONDITION',
+        help='condition the presets must match, like RaysPerEvaluation>500')
+    parser.add_argument('-a', '--aggregate', action='append', default=[],
+        metavar='FUNCTION:KEY',
+        help='aggregate a setting over the presets found, with one of %s' % \
+            ', '.join(sorted(Columns.AGGREGATES)))
+    parser.add_argument('-s', '--set', action='append', default=[],
+        metavar='KEY=VALUE', help='value to set in the presets found')
+    args = parser.parse_args(argv)
+
+    Presets.definitions = Definitions.load(args.definitions)
+    if Presets.definitions is None:
+        parser.error('could not load the definitions file')
+
+    conditions = []
+    for text in args.where:
+        match = CONDITION.match(text)
+        if match is None:
+            parser.error('not a condition: %s' % text)
+        key, op, value = match.groups()
+        conditions.append((key, op, read_value(value)))
+
+    aggregates = []
+    for text in args.aggregate:
+        function, sep, key = text.partition(':')
+        if not sep or function not in Columns.AGGREGATES:
+            parser.error('not an aggregate: %s' % text)
+        aggregates.append((function, key))
+
+    values = {}
+    for text in args.set:
+        key, sep, value = text.partition('=')
+        if not sep:
+            parser.error('not a value to set: %s' % text)
+        values[key.strip()] = read_value(value.strip())
+
+    Presets.path = os.path.abspath(args.presets)
+    Presets.load()
+
+    try:
+        names = Columns.filter(conditions)
+        for name in names:
+            print name
+        print '%d of %d presets' % (len(names), len(Presets.names))
+
+        for function, key in aggregates:
+            print '%s(%s) = %s' % (function, key, \
+                Columns.aggregate(key, function, names))
+    except KeyError, e:
+        parser.error(e.args[0])
+
+    if values:
+        try:
+            changed = Columns.update(names, values)
+            Writer.flush()
+        except (KeyError, ValueError), e:
+            parser.error(e.args[0])
+        # the writer prints why the save failed, and there's no point in
+        # trying again when exiting
+        if Writer.failed:
+            Presets.dirty = False
+            return 1
+        print '%d presets updated' % changed
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())